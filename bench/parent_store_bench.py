@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmark of the computation of the nested sets
+#
+#    Numbers synthetic trees of 10^6 nodes in memory with nested_intervals,
+#    as _parent_store_compute does after its single query, and with the
+#    previous recursive algorithm, which ran two queries per node: they are
+#    counted, not executed.
+#
+#    python bench/parent_store_bench.py [nodes]
+#
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ooda.orm import nested_intervals
+
+
+def recursive(ids, parents):
+    """ the previous _parent_store_compute, with the queries replaced by
+    lookups in a dict; returns the number of queries it ran """
+    children = {}
+    for id, parent in zip(ids, parents):
+        children.setdefault(parent or None, []).append(id)
+    queries = [1]
+
+    def browse_rec(root, pos=0):
+        queries[0] += 2
+        pos2 = pos + 1
+        for id in children.get(root, []):
+            pos2 = browse_rec(id, pos2)
+        return pos2 + 1
+    pos = 0
+    for root in children.get(None, []):
+        pos = browse_rec(root, pos)
+    return queries[0]
+
+
+def trees(count):
+    random.seed(42)
+    yield 'wide', [random.randint(0, i - 1) or False for i in xrange(1, count + 1)]
+    yield 'deep', [i - 1 or False for i in xrange(1, count + 1)]
+
+
+if __name__ == '__main__':
+    count = len(sys.argv) > 1 and int(sys.argv[1]) or 1000000
+    ids = range(1, count + 1)
+    for name, parents in trees(count):
+        start = time.time()
+        nested_intervals(ids, parents)
+        elapsed = time.time() - start
+        start = time.time()
+        try:
+            queries = '%d queries, %.2fs without them' % (recursive(ids, parents), time.time() - start)
+        except RuntimeError, e:
+            queries = 'fails: %s' % (e,)
+        print '%s tree of %d nodes: 1 query + %.2fs; recursive: %s' % (name, count, elapsed, queries)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Micro-benchmark of the post-processing of orm.read
+#
+#    Reads 100k rows from a fake cursor, so that only the conversion of the
+#    rows is measured: read() of the baseline commit, extracted with git
+#    archive, against the columnar read() of the tree, each one run in a
+#    process of its own.
+#
+#    python bench/read_bench.py [rows]
+#
+
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+BASELINE = '7228249'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NAMES = ['name', 'ref', 'qty', 'price', 'done', 'note']
+
+
+class cursor(object):
+    def __init__(self, rows):
+        # one query for all the ids
+        self.IN_MAX = len(rows)
+        self.rows = rows
+        self.description = [(n,) for n in NAMES + ['id']]
+
+    def execute(self, query, params=None):
+        self.rowcount = len(self.rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def dictfetchall(self):
+        # as the cursors of the server, from the tuples of the driver
+        cols = [d[0] for d in self.description]
+        return [dict(zip(cols, row)) for row in self.rows]
+
+
+class rule(object):
+    def domain_get(self, cr, uid, model):
+        return '', []
+
+
+class access(object):
+    def check(self, cr, uid, model, mode, context=None):
+        return True
+
+
+def measure(count, repeat=3):
+    """best time of read() with the ooda found on the path"""
+    from ooda import fields
+    from ooda.orm import orm
+
+    class model(orm):
+        def __init__(self):
+            self.pool = {'ir.rule': rule(), 'ir.model.access': access()}
+            self._name = 'bench.model'
+            self._table = 'bench_model'
+            self._columns = {
+                'name': fields.char('Name', size=64),
+                'ref': fields.char('Reference', size=16),
+                'qty': fields.integer('Quantity'),
+                'price': fields.float('Price'),
+                'done': fields.boolean('Done'),
+                'note': fields.text('Note'),
+            }
+            self._inherit_fields = {}
+            self._log_access = False
+            self.pool[self._name] = self
+
+    rows = [('line %d' % i, i % 3 and 'R%d' % i or None, i % 7 or None,
+             i * 0.5, bool(i % 2), None, i) for i in xrange(1, count + 1)]
+    ids = range(1, count + 1)
+    obj = model()
+    best = None
+    for i in range(repeat):
+        cr = cursor(rows)
+        start = time.time()
+        obj.read(cr, 1, ids, NAMES)
+        elapsed = time.time() - start
+        best = best is None and elapsed or min(best, elapsed)
+    return best
+
+
+def run(path, count):
+    """measure() in a process importing ooda from path"""
+    env = dict(os.environ, PYTHONPATH=path)
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                   '--measure', str(count)], env=env)
+    return float(out)
+
+
+def baseline():
+    """directory of the ooda of the baseline commit"""
+    path = tempfile.mkdtemp()
+    archive = subprocess.Popen(['git', 'archive', BASELINE, 'ooda'],
+                               cwd=ROOT, stdout=subprocess.PIPE)
+    tarfile.open(fileobj=archive.stdout, mode='r|').extractall(path)
+    if archive.wait():
+        raise RuntimeError('git archive %s failed' % BASELINE)
+    return path
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        print repr(measure(int(sys.argv[2])))
+        sys.exit(0)
+    count = len(sys.argv) > 1 and int(sys.argv[1]) or 100000
+    path = baseline()
+    try:
+        before = run(path, count)
+    finally:
+        shutil.rmtree(path)
+    after = run(ROOT, count)
+    print 'read of %d rows: baseline %.3fs, columnar %.3fs (x%.2f)' % (
+        count, before, after, before / after)
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+#
+# Record cache used by browse_record
+#
+#    The values are stored column by column: each model keeps an index from
+#    record id to row number, and one list of values per field. Rows are
+#    appended when a browse_record is created and columns grow lazily when a
+#    field is loaded, so a cached record costs one slot per loaded field
+#    instead of a dict of its own.
+#
+
+import threading
+from collections import OrderedDict
+
+_missing = object()
+
+
+class model_cache(object):
+    """Columnar cache of the records of one model"""
+    __slots__ = ('_index', '_ids', '_columns', '_pending')
+
+    def __init__(self):
+        self._index = {}
+        self._ids = []
+        self._columns = {}
+        # {prefetch group: [row number up to which the group has been
+        #                   fetched, ids before it to fetch again]}
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, id):
+        return id in self._index
+
+    def keys(self):
+        if len(self._index) == len(self._ids):
+            return list(self._ids)
+        return [id for id in self._ids if id is not _missing]
+
+    def add(self, id):
+        if id not in self._index:
+            self._index[id] = len(self._ids)
+            self._ids.append(id)
+
+    def has(self, id, name):
+        col = self._columns.get(name)
+        if col is None:
+            return False
+        pos = self._index.get(id)
+        return pos is not None and pos < len(col) and col[pos] is not _missing
+
+    def get(self, id, name, default=None):
+        col = self._columns.get(name)
+        pos = self._index.get(id)
+        if col is None or pos is None or pos >= len(col):
+            return default
+        value = col[pos]
+        if value is _missing:
+            return default
+        return value
+
+    def value(self, id, name):
+        value = self.get(id, name, _missing)
+        if value is _missing:
+            raise KeyError(name)
+        return value
+
+    def set(self, id, name, value):
+        pos = self._index.get(id)
+        if pos is None:
+            self.add(id)
+            pos = self._index[id]
+        col = self._columns.get(name)
+        if col is None:
+            col = self._columns[name] = []
+        if pos >= len(col):
+            col.extend([_missing] * (pos + 1 - len(col)))
+        col[pos] = value
+
+    def update(self, id, values):
+        for name, value in values.iteritems():
+            self.set(id, name, value)
+
+    def pending(self, key):
+        """ids for which the prefetch group `key` has not been fetched yet
+
+        The returned ids are flagged as fetched: the cost is proportional
+        to the number of ids returned, not to the size of the cache.
+        """
+        state = self._pending.get(key)
+        if state is None:
+            state = self._pending[key] = [0, set()]
+        ids = self._ids[state[0]:]
+        if len(self._index) != len(self._ids):
+            ids = [id for id in ids if id is not _missing]
+        if state[1]:
+            ids = list(state[1]) + ids
+            state[1].clear()
+        state[0] = len(self._ids)
+        return ids
+
+    def groups(self):
+        """prefetch groups fetched at least once in this cache"""
+        return self._pending.keys()
+
+    def unfetched(self, key, ids):
+        """flag `ids` as still pending for the prefetch group `key`"""
+        state = self._pending.get(key)
+        if state is None:
+            state = self._pending[key] = [0, set()]
+        stop = state[0]
+        index = self._index
+        state[1].update(id for id in ids if index.get(id, stop) < stop)
+
+    def forget(self, ids):
+        """drop the records `ids`, which do not exist anymore: their row
+        is left empty and they are not fetched again by any group"""
+        index = self._index
+        rows = [index.pop(id) for id in set(ids) if id in index]
+        if not rows:
+            return
+        for col in self._columns.itervalues():
+            size = len(col)
+            for pos in rows:
+                if pos < size:
+                    col[pos] = _missing
+        for pos in rows:
+            self._ids[pos] = _missing
+        for state in self._pending.itervalues():
+            state[1].difference_update(ids)
+
+    def invalidate(self, ids=None, names=None, keys=None):
+        """forget the values of `names` (all fields if None) for `ids` (all
+        records if None); `keys` are the prefetch groups to fetch again"""
+        if names is None:
+            columns = self._columns.values()
+            keys = self._pending.keys()
+        else:
+            columns = [self._columns[name] for name in names
+                       if name in self._columns]
+        if ids is None:
+            for col in columns:
+                del col[:]
+            for key in keys or ():
+                state = self._pending.get(key)
+                if state is not None:
+                    state[0] = 0
+                    state[1].clear()
+            return
+        index = self._index
+        rows = [index[id] for id in ids if id in index]
+        if not rows:
+            return
+        for col in columns:
+            size = len(col)
+            for pos in rows:
+                if pos < size:
+                    col[pos] = _missing
+        for key in keys or ():
+            state = self._pending.get(key)
+            if state is not None:
+                state[1].update(self._ids[pos] for pos in rows
+                                if pos < state[0])
+
+
+def _width(value):
+    if value is None or value is False:
+        return 0
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return 4 * len(value)
+    if isinstance(value, (long, float)):
+        return 8
+    return 4
+
+
+class prefetch_counters(object):
+    """Cells and bytes fetched, and saved, by the prefetch groups
+
+    The savings of a fetch are the classic columns it did not read; their
+    size is estimated from the average width observed for each column when
+    it is fetched. Enabled by config['prefetch_stats'].
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._groups = {}
+        self._widths = {}
+
+    def record(self, model, key, names, skipped, rows):
+        stats = self._groups.get((model, key))
+        if stats is None:
+            stats = self._groups[(model, key)] = {
+                'fetches': 0, 'rows': 0, 'columns': 0, 'bytes': 0,
+                'skipped': {},
+            }
+        count = len(rows)
+        stats['fetches'] += 1
+        stats['rows'] += count
+        stats['columns'] += count * len(names)
+        for name in names:
+            size = 0
+            for row in rows:
+                size += _width(row.get(name))
+            stats['bytes'] += size
+            width = self._widths.setdefault((model, name), [0, 0])
+            width[0] += size
+            width[1] += count
+        for name in skipped:
+            stats['skipped'][name] = stats['skipped'].get(name, 0) + count
+
+    def report(self, model=None):
+        """{(model, group): {'fetches', 'rows', 'columns', 'bytes',
+        'columns_saved', 'bytes_saved'}}"""
+        res = {}
+        for (name, key), stats in self._groups.items():
+            if model and name != model:
+                continue
+            saved = 0
+            for column, cells in stats['skipped'].items():
+                size, count = self._widths.get((name, column), (0, 0))
+                if count:
+                    saved += cells * size / count
+            res[(name, key)] = {
+                'fetches': stats['fetches'],
+                'rows': stats['rows'],
+                'columns': stats['columns'],
+                'bytes': stats['bytes'],
+                'columns_saved': sum(stats['skipped'].values()),
+                'bytes_saved': saved,
+            }
+        return res
+
+prefetch_stats = prefetch_counters()
+
+
+class browse_cache(dict):
+    """Cache shared by the records of a browse() call: {model: model_cache}
+
+    Also keeps the res.lang records and the field processors used when
+    browsing with fields_process.
+    """
+    __slots__ = ('langs', 'processors')
+
+    def __init__(self):
+        super(browse_cache, self).__init__()
+        self.langs = {}
+        self.processors = {}
+
+    def model(self, name):
+        data = self.get(name)
+        if data is None:
+            data = self[name] = model_cache()
+        return data
+
+
+class lru_cache(object):
+    """Mapping keeping only the `size` most recently used entries, shared
+    by threads"""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, _missing)
+            if value is _missing:
+                return default
+            self._data[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def keys(self):
+        with self._lock:
+            return self._data.keys()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+#
+# Transaction cache
+#
+#    Opt-in with enable_transaction_cache(cr): the browse() calls made on the
+#    cursor then share one browse_cache per (uid, context) until the
+#    transaction ends. Writes invalidate what they touch, see
+#    orm_template._invalidate_cache; commit and rollback drop everything.
+#
+
+class transaction_state(dict):
+    """Data attached to a cursor, emptied when its transaction ends
+
+    `options` survive the end of the transaction. The functions listed in
+    state['before_commit'] are called before the transaction is committed,
+    the ones in state['after_commit'] once it is, and the ones in
+    state['on_rollback'] when it is rolled back.
+    """
+    __slots__ = ('options',)
+
+    def __init__(self):
+        super(transaction_state, self).__init__()
+        self.options = {}
+
+
+def cursor_state(cr, create=True):
+    """transaction_state of the cursor, None if it cannot hold one"""
+    state = getattr(cr, '_ooda_state', None)
+    if state is not None or not create:
+        return state
+    commit = getattr(cr, 'commit', None)
+    rollback = getattr(cr, 'rollback', None)
+    if commit is None or rollback is None:
+        return None
+    state = transaction_state()
+
+    def _commit(*args, **kwargs):
+        for callback in state.pop('before_commit', []):
+            callback()
+        callbacks = state.get('after_commit', [])
+        state.clear()
+        res = commit(*args, **kwargs)
+        for callback in callbacks:
+            callback()
+        return res
+
+    def _rollback(*args, **kwargs):
+        callbacks = state.get('on_rollback', [])
+        state.clear()
+        for callback in callbacks:
+            callback()
+        return rollback(*args, **kwargs)
+    try:
+        cr._ooda_state = state
+        cr.commit = _commit
+        cr.rollback = _rollback
+    except (AttributeError, TypeError):
+        return None
+    return state
+
+
+def enable_transaction_cache(cr, enable=True):
+    """share the browse cache between the browse() calls made on `cr`"""
+    state = cursor_state(cr, create=enable)
+    if state is None:
+        return False
+    state.options['browse_cache'] = enable
+    if not enable:
+        state.pop('browse_cache', None)
+    return True
+
+
+def transaction_cache(cr, uid, context):
+    """browse_cache shared by the transaction, None if not enabled"""
+    state = cursor_state(cr, create=False)
+    if state is None or not state.options.get('browse_cache'):
+        return None
+    caches = state.get('browse_cache')
+    if caches is None:
+        caches = state['browse_cache'] = {}
+    key = (uid, tuple(sorted((k, repr(v))
+                             for k, v in (context or {}).iteritems())))
+    cache = caches.get(key)
+    if cache is None:
+        cache = caches[key] = browse_cache()
+    return cache
+
+
+def transaction_caches(cr):
+    """browse_caches shared by the transaction"""
+    state = cursor_state(cr, create=False)
+    if state is None:
+        return []
+    return state.get('browse_cache', {}).values()
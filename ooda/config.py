@@ -1,5 +1,12 @@
 # coding=utf-8
 config = dict(
     csv_internal_sep=',',
-    import_partial=None
+    import_partial=None,
+    prefetch_stats=False,
+    translation_cache_size=64,
+    selection_cache_size=1024,
+    selection_cache_ttl=0,
+    store_chunk_time=1.0,
+    store_chunk_max=50000,
+    parent_store_insert_max=100,
 )
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Concurrent computation of function fields
+#
+#    Opt-in with set_executor(cr, snapshot_executor(factory)): the independent
+#    groups of function fields read, or stored, on the cursor are then
+#    computed in threads, each one with a cursor of its own bound to the
+#    snapshot of the transaction of `cr` (SET TRANSACTION SNAPSHOT). Their
+#    results are merged in the order of the groups.
+#
+#    A snapshot does not see the uncommitted changes of the transaction that
+#    exported it, so once the transaction has written the groups are
+#    computed one after another on `cr`, as without executor.
+#
+#    background_task runs maintenance functions, like the rebalance of the
+#    gapped nested sets, periodically in a thread of its own.
+#
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from ooda.cache import cursor_state
+
+logger = logging.getLogger('ooda.executor')
+
+
+class snapshot_executor(object):
+    """Calls functions of a cursor in threads, on the snapshot of a cursor
+
+    `cursor_factory` returns a new cursor on the database, with its own
+    connection; the cursors are rolled back and closed after each call.
+    """
+
+    def __init__(self, cursor_factory, workers=4):
+        self.cursor_factory = cursor_factory
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _threads(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def snapshot(self, cr):
+        """snapshot of the transaction of `cr`, None if it has written"""
+        cr.execute('SELECT txid_current_if_assigned() IS NULL')
+        if not cr.fetchone()[0]:
+            return None
+        cr.execute('SELECT pg_export_snapshot()')
+        return cr.fetchone()[0]
+
+    def _call(self, snapshot, fnct):
+        wcr = self.cursor_factory()
+        try:
+            wcr.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            wcr.execute('SET TRANSACTION SNAPSHOT %s', (snapshot,))
+            return fnct(wcr)
+        finally:
+            wcr.rollback()
+            wcr.close()
+
+    def map(self, cr, fncts):
+        """[fnct(cursor) for fnct in fncts], computed concurrently"""
+        snapshot = len(fncts) > 1 and self.snapshot(cr)
+        if not snapshot:
+            return [fnct(cr) for fnct in fncts]
+        return self._threads().map(lambda fnct: self._call(snapshot, fnct), fncts)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+def set_executor(cr, executor):
+    """compute the function fields on `cr` with `executor`, None to stop"""
+    state = cursor_state(cr, create=executor is not None)
+    if state is None:
+        return False
+    if executor is None:
+        state.options.pop('executor', None)
+    else:
+        state.options['executor'] = executor
+    return True
+
+
+def get_executor(cr):
+    """executor of the function fields of `cr`, None if not set"""
+    state = cursor_state(cr, create=False)
+    return state is not None and state.options.get('executor') or None
+
+
+class background_task(threading.Thread):
+    """Calls fnct(cursor) every `interval` seconds in a daemon thread, with
+    a cursor of `cursor_factory` committed after each call"""
+
+    def __init__(self, cursor_factory, fnct, interval=300):
+        super(background_task, self).__init__()
+        self.daemon = True
+        self.cursor_factory = cursor_factory
+        self.fnct = fnct
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run_once(self):
+        cr = self.cursor_factory()
+        try:
+            res = self.fnct(cr)
+            cr.commit()
+            return res
+        except Exception:
+            cr.rollback()
+            logger.exception('Background task %r failed', self.fnct)
+        finally:
+            cr.close()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def stop(self):
+        self._stop_event.set()
@@ -13,7 +13,7 @@ class expression(object):
         return isinstance(element, (str, unicode)) and element in ['&', '|', '!']
 
     def _is_leaf(self, element, internal=False):
-        OPS = ('=', '!=', '<>', '<=', '<', '>', '>=', '=like', 'like', 'not like', 'ilike', 'not ilike', 'in', 'not in', 'child_of')
+        OPS = ('=', '!=', '<>', '<=', '<', '>', '>=', '=like', 'like', 'not like', 'ilike', 'not ilike', 'in', 'not in', 'child_of', 'parent_of')
         INTERNAL_OPS = OPS + ('inselect',)
         return (isinstance(element, tuple) or isinstance(element, list)) \
            and len(element) == 3 \
@@ -59,9 +59,30 @@ class expression(object):
         if not self.__exp:
             return self
 
-        def _rec_get(ids, table, parent=None, left='id', prefix=''):
-            if len(ids) < 9000 and table._parent_store and (not table.pool
-            ._init):
+        def _rec_get(ids, table, parent=None, left='id', prefix='', operator='child_of'):
+            if table._parent_store == 'path' and (parent or table._parent_name) == table._parent_name \
+                    and not table.pool._init:
+                # one predicate on the paths, using their index
+                ids = [int(id) for id in ids]
+                array = 'ARRAY[%s]::integer[]' % ','.join(['%s'] * len(ids))
+                if operator == 'child_of':
+                    query = 'SELECT id FROM "%s" WHERE parent_path && %s' % (table._table, array)
+                else:
+                    query = 'SELECT unnest(parent_path) FROM "%s" WHERE id = ANY(%s)' % (table._table, array)
+                return [(left, 'inselect', (query, ids))]
+            if operator == 'parent_of':
+                def rg_up(ids):
+                    res = []
+                    while ids:
+                        res += ids
+                        ids = [r[parent or table._parent_name][0]
+                               for r in table.read(cr, uid, ids, [parent or table._parent_name], context=context)
+                               if r[parent or table._parent_name]]
+                        ids = [id for id in ids if id not in res]
+                    return res
+                return [(left, 'in', rg_up(ids))]
+            if len(ids) < 9000 and table._parent_store not in (False, 'path') \
+                    and not table.pool._init:
 # TODO: Improve where joins are implemented for many with '.', replace by:
 # doms += ['&',(prefix+'.parent_left','<',o.parent_right),(prefix+'.parent_left','>=',o.parent_left)]
                 doms = []
@@ -112,8 +133,10 @@ class expression(object):
             
             field = working_table._columns.get(fargs[0], False)
             if not field:
-                if left == 'id' and operator == 'child_of':
-                    dom = _rec_get(right, working_table)
+                if left == 'id' and operator in ('child_of', 'parent_of'):
+                    if isinstance(right, (int, long)):
+                        right = [right]
+                    dom = _rec_get(right, working_table, operator=operator)
                     self.__exp = self.__exp[:i] + dom + self.__exp[i+1:]
                 continue
 
@@ -251,17 +274,19 @@ class expression(object):
                         self.__exp[i] = ('id', m2m_op, self.__execute_recursive_in(cr, field._id1, field._rel, field._id2, [], operator,  field._type) or [0])
 
             elif field._type == 'many2one':
-                if operator == 'child_of':
+                if operator in ('child_of', 'parent_of'):
                     if isinstance(right, basestring):
                         ids2 = [x[0] for x in field_obj.name_search(cr, uid, right, [], 'like', limit=None)]
+                    elif isinstance(right, (int, long)):
+                        ids2 = [right]
                     else:
                         ids2 = list(right)
 
                     self.__operator = 'in'
                     if field._obj != working_table._name:
-                        dom = _rec_get(ids2, field_obj, left=left, prefix=field._obj)
+                        dom = _rec_get(ids2, field_obj, left=left, prefix=field._obj, operator=operator)
                     else:
-                        dom = _rec_get(ids2, working_table, parent=left)
+                        dom = _rec_get(ids2, working_table, parent=left, operator=operator)
                     self.__exp = self.__exp[:i] + dom + self.__exp[i+1:]
                 else:
                     
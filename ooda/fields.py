@@ -14,6 +14,8 @@
 
 from psycopg2 import Binary
 import warnings
+import tempfile
+import mmap
 
 from ooda import tools
 
@@ -30,6 +32,7 @@ class _column(object):
     _classic_read = True
     _classic_write = True
     _prefetch = True
+    _prefetch_x2many = False
     _properties = False
     _type = 'unknown'
     _obj = None
@@ -165,12 +168,88 @@ class time(_column):
     _type = 'time'
 
 
+def is_stream(value):
+    """ whether value is a file-like object to write in chunks """
+    return hasattr(value, 'read') and not isinstance(value, basestring)
+
+
+class binary_handle(object):
+    """ Value of a binary field read with context['bin_lazy']
+
+    The content is fetched on demand, in chunks, with substring() on the
+    column, through the cursor of the read: it is only readable while this
+    cursor is open.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, cr, table, name, id, size):
+        self._cr = cr
+        self.table = table
+        self.name = name
+        self.id = id
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __nonzero__(self):
+        return self.size > 0
+
+    def __repr__(self):
+        return '<binary_handle %s.%s,%s (%d bytes)>' % (self.table, self.name, self.id, self.size)
+
+    def read_chunk(self, offset, length):
+        self._cr.execute('SELECT substring("%s" from %%s for %%s) FROM "%s" WHERE id=%%s' % (self.name, self.table),
+                         (offset + 1, length, self.id))
+        res = self._cr.fetchone()
+        return res and res[0] and str(res[0]) or ''
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.chunk_size
+        for offset in xrange(0, self.size, chunk_size):
+            yield self.read_chunk(offset, chunk_size)
+
+    def read(self):
+        return ''.join(self.chunks())
+
+    __str__ = read
+
+    def copy_to(self, fileobj, chunk_size=None):
+        for chunk in self.chunks(chunk_size):
+            fileobj.write(chunk)
+
+    def spool(self):
+        """ temporary file holding the content """
+        res = tempfile.TemporaryFile()
+        self.copy_to(res)
+        res.flush()
+        res.seek(0)
+        return res
+
+    def mmap(self):
+        """ read only memory map of the content, spooled to a temporary
+        file; buffer() of it gives zero-copy slices """
+        if not self.size:
+            return ''
+        tmp = self.spool()
+        try:
+            return mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            tmp.close()
+
+
+def _binary_get(x):
+    if isinstance(x, binary_handle):
+        return x
+    return x and str(x)
+
+
 class binary(_column):
     _type = 'binary'
     _symbol_c = '%s'
     _symbol_f = lambda symb: symb and Binary(symb) or None
     _symbol_set = (_symbol_c, _symbol_f)
-    _symbol_get = lambda self, x: x and str(x)
+    _symbol_get = lambda self, x: _binary_get(x)
 
     _classic_read = False
     _prefetch = False
@@ -179,6 +258,21 @@ class binary(_column):
         _column.__init__(self, string=string, **args)
         self.filters = filters
 
+    def set_stream(self, cr, obj, ids, name, stream, chunk_size=None):
+        """ write the content of the file-like object stream, read in
+        chunks staged in a temporary table, to the column in one UPDATE
+        instead of one string """
+        chunk_size = chunk_size or binary_handle.chunk_size
+        tmp = ('_stream_%s_%s' % (obj._table, name))[:63]
+        cr.execute('CREATE TEMP TABLE "%s" (seq serial, chunk bytea) ON COMMIT DROP' % (tmp,))
+        chunk = stream.read(chunk_size)
+        while chunk:
+            cr.execute('INSERT INTO "%s" (chunk) VALUES (%%s)' % (tmp,), (Binary(chunk),))
+            chunk = stream.read(chunk_size)
+        cr.execute('UPDATE "%s" SET "%s"=(SELECT string_agg(chunk, \'\'::bytea ORDER BY seq) FROM "%s") WHERE id IN %%s'
+                   % (obj._table, name, tmp), (tuple(ids),))
+        cr.execute('DROP TABLE "%s"' % (tmp,))
+
     def get_memory(self, cr, obj, ids, name, user=None, context=None, values=None):
         if not context:
             context = {}
@@ -333,11 +427,14 @@ class one2many(_column):
     _prefetch = False
     _type = 'one2many'
 
-    def __init__(self, obj, fields_id, string='unknown', limit=None, **args):
+    def __init__(self, obj, fields_id, string='unknown', limit=None, prefetch=False, **args):
         _column.__init__(self, string=string, **args)
         self._obj = obj
         self._fields_id = fields_id
         self._limit = limit
+        # prefetched by browse_record with the other x2many fields of the
+        # model flagged the same way, for every record in the cache
+        self._prefetch_x2many = prefetch
         #one2many can't be used as condition for defaults
         assert(self.change_default != True)
 
@@ -461,7 +558,7 @@ class many2many(_column):
     _prefetch = False
     _type = 'many2many'
 
-    def __init__(self, obj, rel, id1, id2, string='unknown', limit=None, **args):
+    def __init__(self, obj, rel, id1, id2, string='unknown', limit=None, prefetch=False, **args):
         _column.__init__(self, string=string, **args)
         self._obj = obj
         if '.' in rel:
@@ -471,6 +568,7 @@ class many2many(_column):
         self._id1 = id1
         self._id2 = id2
         self._limit = limit
+        self._prefetch_x2many = prefetch
 
     def get(self, cr, obj, ids, name, user=None, offset=0, context=None, values=None):
         if not context:
@@ -55,8 +55,19 @@ import tools
 import copy
 import sys
 import operator
+import array
+import itertools
+import StringIO
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from ooda import fields
+from ooda.cache import browse_cache, model_cache, prefetch_stats, \
+    transaction_cache, transaction_caches, cursor_state, lru_cache
+from ooda.executor import get_executor
 from ooda.tools import safe_eval as eval
 from ooda.tools import SKIPPED_ELEMENT_TYPES
 
@@ -78,6 +89,429 @@ def last_day_of_current_month():
 def intersect(la, lb):
     return set(la).intersection(lb)
 
+# models whose changes invalidate the groups of the users
+_group_models = ('res.groups', 'res.users', 'ir.model.data')
+
+def user_groups(cr, uid):
+    """ xml ids ('module.name') of the groups of the user, loaded with one
+    query, kept until the end of the transaction when the cursor holds a
+    state, see invalidate_user_groups() """
+    state = cursor_state(cr, create=False)
+    cache = None
+    if state is not None:
+        cache = state.get('user_groups')
+        if cache is None:
+            cache = state['user_groups'] = {}
+        if uid in cache:
+            return cache[uid]
+    cr.execute("SELECT d.module, d.name FROM res_groups_users_rel r "
+               "JOIN ir_model_data d ON (d.res_id = r.gid AND d.model = 'res.groups') "
+               "WHERE r.uid = %s", (uid,))
+    groups = frozenset('%s.%s' % x for x in cr.fetchall())
+    if cache is not None:
+        cache[uid] = groups
+    return groups
+
+def invalidate_user_groups(cr, uid=None):
+    """ forget the groups of the user (of all the users if uid is None) """
+    state = cursor_state(cr, create=False)
+    if state is None:
+        return
+    if uid is None:
+        state.pop('user_groups', None)
+        state.pop('user_in_groups', None)
+        return
+    state.get('user_groups', {}).pop(uid, None)
+    answers = state.get('user_in_groups', {})
+    for key in [k for k in answers if k[0] == uid]:
+        del answers[key]
+
+def user_in_groups(cr, uid, groups, pool=None):
+    """ whether the user belongs to one of the groups ('module.name'),
+    asked to the check_groups of ir.model.access in pool when it has one,
+    as user_groups() otherwise """
+    access = pool is not None and pool.get('ir.model.access')
+    check = access and getattr(access, 'check_groups', None)
+    if not check:
+        return bool(user_groups(cr, uid).intersection(groups))
+    state = cursor_state(cr, create=False)
+    answers = {}
+    if state is not None:
+        answers = state.setdefault('user_in_groups', {})
+    for group in groups:
+        key = (uid, group)
+        if key not in answers:
+            answers[key] = bool(check(cr, uid, group))
+        if answers[key]:
+            return True
+    return False
+
+# {(database, model, lang): {(type, field, src): value}} of the labels,
+# helps and selections of the fields, see model_translations()
+_translations = lru_cache(config.get('translation_cache_size', 64))
+
+def model_translations(cr, model, lang):
+    """ {(type, field, src): value} of the translated labels ('field'),
+    helps ('help') and selections ('selection') of the fields of model,
+    loaded with one query; src is None for a lookup on any source """
+    key = (getattr(cr, 'dbname', None), model._name, lang)
+    res = _translations.get(key)
+    if res is not None:
+        return res
+    res = {}
+    if lang:
+        names = [model._name + ',' + f for f in model._columns]
+        cr.execute("SELECT name, type, src, value FROM ir_translation "
+                   "WHERE lang=%s AND type IN ('field', 'help', 'selection') "
+                   "AND name = ANY(%s)", (lang, names))
+        for name, type, src, value in cr.fetchall():
+            field = name.split(',', 1)[1]
+            res.setdefault((type, field, src), value or '')
+            res.setdefault((type, field, None), value or '')
+    _translations.size = config.get('translation_cache_size', 64)
+    _translations[key] = res
+    return res
+
+def invalidate_translations(cr=None):
+    """ forget the translations loaded by model_translations (those of the
+    database of cr only if given, again when its transaction ends: the
+    old ones may have been loaded meanwhile by another transaction) """
+    if cr is None:
+        _translations.clear()
+        return
+    dbname = getattr(cr, 'dbname', None)
+
+    def invalidate():
+        for key in _translations.keys():
+            if key[0] == dbname:
+                _translations.pop(key)
+    invalidate()
+    state = cursor_state(cr)
+    if state is not None and not state.get('translations_changed'):
+        state['translations_changed'] = True
+        state.setdefault('after_commit', []).append(invalidate)
+        state.setdefault('on_rollback', []).append(invalidate)
+
+def read_translations(cr, model, fields, lang, ids):
+    """ {(field, id): value} of the translations of fields of the records
+    ids, loaded with one query """
+    if not (fields and ids):
+        return {}
+    names = dict((model._name + ',' + f, f) for f in fields)
+    cr.execute("SELECT name, res_id, value FROM ir_translation "
+               "WHERE lang=%s AND type='model' AND name = ANY(%s) "
+               "AND res_id = ANY(%s)", (lang, names.keys(), list(ids)))
+    return dict(((names[name], res_id), value)
+                for name, res_id, value in cr.fetchall())
+
+# {(database, model, field, lang, uid): (time, values)} of the dynamic
+# selections, see selection_keys()
+_selections = lru_cache(config.get('selection_cache_size', 1024))
+
+def selection_keys(cr, uid, model, field, context=None):
+    """ frozenset of the values of the selection of field, the ones of a
+    dynamic selection kept config['selection_cache_ttl'] seconds when set:
+    a value added meanwhile is rejected until they expire, or until
+    invalidate_selections() """
+    column = model._columns[field]
+    if isinstance(column.selection, (tuple, list)):
+        if model._static_selections is None:
+            model._init_selections()
+        keys = model._static_selections.get(field)
+        if keys is None:
+            keys = model._static_selections[field] = frozenset(dict(column.selection))
+        return keys
+    context = context or {}
+    ttl = config.get('selection_cache_ttl', 0)
+    key = (getattr(cr, 'dbname', None), model._name, field, context.get('lang', False), uid)
+    now = time.time()
+    cached = _selections.get(key)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+    keys = frozenset(dict(column.selection(model, cr, uid, context=context)))
+    if ttl:
+        _selections.size = config.get('selection_cache_size', 1024)
+        _selections[key] = (now, keys)
+    return keys
+
+def invalidate_selections(model=None, field=None):
+    """ forget the dynamic selections kept by selection_keys, those of
+    model (and field) only if given """
+    for key in _selections.keys():
+        if (model is None or key[1] == model) and (field is None or key[2] == field):
+            _selections.pop(key)
+
+# (database, model) of the nested sets whose gaps ran out
+_rebalance_queue = set()
+
+def queue_parent_rebalance(cr, model):
+    """ have the nested set of model respaced by rebalance_parent_stores """
+    _rebalance_queue.add((getattr(cr, 'dbname', None), model))
+
+def rebalance_parent_stores(cr, pool):
+    """ recompute, with their gaps, the nested sets queued for the database
+    of cr; returns the models done
+
+    Each table is locked against writes until the end of the transaction,
+    so that no record is placed in a gap while the tree is renumbered.
+    Meant to run in the background, e.g. with ooda.executor.background_task
+    """
+    dbname = getattr(cr, 'dbname', None)
+    done = []
+    for key in list(_rebalance_queue):
+        if key[0] != dbname:
+            continue
+        model = pool.get(key[1])
+        if model is not None:
+            cr.execute('LOCK TABLE "%s" IN EXCLUSIVE MODE' % (model._table,))
+            model._parent_store_compute(cr)
+            model._invalidate_cache(cr, None, model._parent_store_columns())
+            done.append(key[1])
+        _rebalance_queue.discard(key)
+    return done
+
+def _forest(ids, parents):
+    """ (start, children) arrays of the forest of ids and their parents:
+    the positions of the children of the node at position i, in the order
+    of ids, are children[start[i + 1]:start[i + 2]], those of the roots
+    children[start[0]:start[1]] """
+    count = len(ids)
+    index = dict(itertools.izip(ids, xrange(count)))
+    # children of each node, the roots under the slot 0, stored contiguously
+    slots = array.array('l', [-1]) * count
+    start = array.array('l', [0]) * (count + 2)
+    for i, parent in enumerate(parents):
+        if not parent:
+            slot = 0
+        else:
+            slot = index.get(parent, -1) + 1
+            if not slot:
+                continue
+        slots[i] = slot
+        start[slot + 2] += 1
+    for slot in xrange(2, count + 2):
+        start[slot] += start[slot - 1]
+    children = array.array('l', [0]) * count
+    for i in xrange(count):
+        slot = slots[i]
+        if slot >= 0:
+            children[start[slot + 1]] = i
+            start[slot + 1] += 1
+    return start, children
+
+def nested_intervals(ids, parents, gap=0):
+    """ (left, right) arrays of the nested set of the forest of ids and
+    their parents, the siblings numbered in the order of ids, with gap
+    spare positions at the end of each interval
+
+    The nodes not reachable from a root (whose parent is missing or in a
+    cycle) get -1. """
+    count = len(ids)
+    start, children = _forest(ids, parents)
+    # the children of slot are from start[slot] to start[slot + 1], the
+    # first one not numbered yet at first[slot]
+    first = array.array('l', start)
+    left = array.array('l', [-1]) * count
+    right = array.array('l', [-1]) * count
+    pos = 0
+    stack = [0]
+    while stack:
+        slot = stack[-1]
+        if first[slot] < start[slot + 1]:
+            i = children[first[slot]]
+            first[slot] += 1
+            left[i] = pos
+            pos += 1
+            stack.append(i + 1)
+        else:
+            stack.pop()
+            if slot:
+                pos += gap
+                right[slot - 1] = pos
+                pos += 1
+    return left, right
+
+def materialized_paths(ids, parents):
+    """ [ids of the ancestors of each node, up to the node itself] of the
+    forest of ids and their parents, None for the nodes not reachable from
+    a root """
+    start, children = _forest(ids, parents)
+    first = array.array('l', start)
+    paths = [None] * len(ids)
+    path = []
+    stack = [0]
+    while stack:
+        slot = stack[-1]
+        if first[slot] < start[slot + 1]:
+            i = children[first[slot]]
+            first[slot] += 1
+            path.append(ids[i])
+            paths[i] = list(path)
+            stack.append(i + 1)
+        else:
+            stack.pop()
+            if slot:
+                path.pop()
+    return paths
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if value is True or value is False:
+        return value and 't' or 'f'
+    if isinstance(value, (list, tuple)):
+        return '{%s}' % ','.join(map(str, value))
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+def bulk_update(cr, table, columns, rows, changed_only=False, chunk_size=100000, copy=True):
+    """ update the [(name, SQL type)] columns of table from the rows (id,
+    value of each column), through a temporary table filled with COPY
+    when the cursor supports it (and copy is set), INSERTs otherwise; with
+    changed_only the rows whose values are the same are not touched
+
+    Returns the number of rows updated. """
+    names = ['"%s"' % (name,) for name, type in columns]
+    tmp = '"%s"' % (('_bulk_' + table)[:63],)
+    cr.execute('CREATE TEMP TABLE %s (id integer, %s) ON COMMIT DROP' % (
+        tmp, ', '.join(['"%s" %s' % (name, type) for name, type in columns])))
+    copy_expert = copy and getattr(cr, 'copy_expert', None)
+    copy_query = 'COPY %s (id, %s) FROM STDIN' % (tmp, ', '.join(names))
+    insert = 'INSERT INTO %s (id, %s) VALUES ' % (tmp, ', '.join(names))
+    value = '(' + ','.join(['%s'] * (len(names) + 1)) + ')'
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, copy_expert and chunk_size or cr.IN_MAX))
+        if not chunk:
+            break
+        if copy_expert:
+            copy_expert(copy_query, StringIO.StringIO(''.join(['\t'.join(map(_copy_value, row)) + '\n'
+                                                               for row in chunk])))
+        else:
+            cr.execute(insert + ','.join([value] * len(chunk)), tuple(itertools.chain(*chunk)))
+    query = 'UPDATE "%s" SET %s FROM %s _b WHERE "%s".id = _b.id' % (
+        table, ', '.join(['%s = _b.%s' % (name, name) for name in names]), tmp, table)
+    if changed_only:
+        query += ' AND (%s)' % ' OR '.join(['"%s".%s IS DISTINCT FROM _b.%s' % (table, name, name)
+                                            for name in names])
+    cr.execute(query)
+    count = cr.rowcount
+    cr.execute('DROP TABLE %s' % (tmp,))
+    return count
+
+def enable_deferred_recompute(cr, enable=True):
+    """ queue the stored function fields to recompute after the writes made
+    on cr, until flush_recompute(cr), the commit, or a read or search of
+    the pending fields """
+    state = cursor_state(cr, create=enable)
+    if state is None:
+        return False
+    if not enable:
+        flush_recompute(cr)
+    state.options['deferred_recompute'] = enable
+    return True
+
+def queue_recompute(cr, pool, uid, triggers, context):
+    """ queue the (priority, model, ids, fields) triggers, merged with the
+    ones of the same priority, model, fields, user and context; False when
+    cr does not defer them """
+    state = cursor_state(cr, create=False)
+    if state is None or not state.options.get('deferred_recompute'):
+        return False
+    queue = state.get('recompute')
+    if queue is None:
+        queue = state['recompute'] = {}
+        if not state.get('recompute_hooked'):
+            state['recompute_hooked'] = True
+            state.setdefault('before_commit', []).append(lambda: flush_recompute(cr))
+    ctx = tuple(sorted((k, repr(v)) for k, v in (context or {}).iteritems()))
+    for order, model, ids, fields in triggers:
+        key = (order, model, tuple(sorted(fields)), uid, ctx)
+        entry = queue.get(key)
+        if entry is None:
+            entry = queue[key] = (set(), context, pool.get(model))
+        entry[0].update(ids)
+        # browsed again through read(), which flushes them
+        entry[2]._invalidate_cache(cr, ids, fields)
+    return True
+
+def recompute_pending(cr):
+    """ {model: fields} of the recomputations queued on cr """
+    state = cursor_state(cr, create=False)
+    if state is None or not state.get('recompute'):
+        return {}
+    res = {}
+    for order, model, fields, uid, ctx in state['recompute']:
+        res.setdefault(model, set()).update(fields)
+    return res
+
+def flush_recompute(cr):
+    """ recompute the stored function fields queued on cr, one call per
+    priority, model and fields, in the order of the priorities """
+    state = cursor_state(cr, create=False)
+    while state is not None and state.get('recompute'):
+        # the recomputations may read, and queue new ones
+        queue = state.pop('recompute')
+        for key in sorted(queue):
+            order, name, fields, uid, ctx = key
+            ids, context, model = queue[key]
+            ids = list(ids)
+            existing = []
+            for i in range(0, len(ids), cr.IN_MAX):
+                cr.execute('SELECT id FROM "%s" WHERE id IN %%s' % (model._table,),
+                           (tuple(ids[i:i+cr.IN_MAX]),))
+                existing.extend([row[0] for row in cr.fetchall()])
+            if existing:
+                model._store_set_values(cr, uid, sorted(existing), list(fields), context)
+
+def _qualify_order(order, table, columns):
+    """ order with its columns prefixed by table, None when it is not a plain
+    list of columns """
+    res = []
+    for term in order.split(','):
+        words = term.split()
+        if not words:
+            continue
+        name = words[0].strip('"')
+        if name not in columns or len(words) > 2:
+            return None
+        res.append(' '.join(['"%s"."%s"' % (table, name)] + words[1:]))
+    return ', '.join(res)
+
+# names of the server side cursors opened by read_iter
+_cursor_names = itertools.count()
+
+def _no_permission(value):
+    """ the value read in a field the user is not allowed to read """
+    if type(value) == type([]):
+        return []
+    elif type(value) == type(0.0):
+        return 0
+    elif type(value) == type(''):
+        return '=No Permission='
+    return False
+
+# array.array typecodes of the fields returned as arrays by read_columns
+_array_types = {
+    'integer': 'l',
+    'integer_big': 'l',
+    'float': 'd',
+    'boolean': 'b',
+    'many2one': 'l',
+    'one2one': 'l',
+}
+
+def _make_array(typecode, values, container):
+    if container == 'numpy' and numpy is not None:
+        return numpy.array(values, dtype=typecode == 'b' and bool or typecode)
+    if container in ('array', 'numpy'):
+        return array.array(typecode, [v or 0 for v in values])
+    return values
+
 class except_orm(Exception):
     exc_type = 'error'
 
@@ -115,6 +549,7 @@ class BrowseRecordError(Exception):
 
 # Readonly python database object browser
 class browse_null(object):
+    __slots__ = ('id',)
 
     def __init__(self):
         self.id = False
@@ -138,10 +573,13 @@ class browse_null(object):
         return u''
 
 
-#
-# TODO: execute an object method on browse_record_list
-#
 class browse_record_list(list):
+    """List of browse records
+
+    The helpers below work on all the records at once: a field is read
+    with one query per model for all the records lacking it, and the
+    methods of the model are called once with the ids of the list.
+    """
 
     def __init__(self, lst, context=None):
         if not context:
@@ -149,11 +587,176 @@ class browse_record_list(list):
         super(browse_record_list, self).__init__(lst)
         self.context = context
 
+    def __getattr__(self, name):
+        if name.startswith('_') or not len(self):
+            raise AttributeError(name)
+        groups = self._groups()
+        if len(groups) > 1:
+            raise BrowseRecordError('Cannot call %s on records of several objects' % (name,))
+        records = groups[0]
+        method = getattr(records[0]._table, name, None)
+        if not isinstance(method, types.MethodType):
+            raise AttributeError(name)
+        record = records[0]
+        ids = [r._id for r in records]
+        return lambda *args, **kwargs: method(record._cr, record._uid, ids, *args, **kwargs)
+
+    @property
+    def ids(self):
+        return [record.id for record in self]
+
+    def _groups(self, key=None):
+        """the records grouped by model (and by `key`), in order"""
+        res = {}
+        groups = []
+        for record in self:
+            if not isinstance(record, browse_record):
+                continue
+            k = (record._table_name, record._uid, key and key(record))
+            if k not in res:
+                res[k] = []
+                groups.append(res[k])
+            res[k].append(record)
+        return groups
+
+    def _prefetch(self, name):
+        """read the field `name` of all the records lacking it"""
+        missing = lambda r: not r._data.has(r._id, name)
+        for records in self._groups(lambda r: id(r._data)):
+            records = filter(missing, records)
+            if not records:
+                continue
+            record = records[0]
+            keys = record._table._get_prefetch_map()[0]
+            if name in keys:
+                record._data.unfetched(keys[name], [r._id for r in records])
+            record[name]
+
+    def _mapped(self, name):
+        self._prefetch(name)
+        values = [record[name] for record in self
+                  if isinstance(record, browse_record)]
+        if not len(self):
+            return self.__class__([], self.context)
+        table = self[0]._table
+        col = table._columns.get(name) or \
+            (name in table._inherit_fields and table._inherit_fields[name][2])
+        if not col or not (col._type in ('many2one', 'one2one', 'one2many', 'many2many') or
+                           (col._type == 'reference' and self.context.get('browse_reference'))):
+            return values
+        res = []
+        seen = set()
+        for value in values:
+            if isinstance(value, browse_record):
+                value = [value]
+            for record in value or []:
+                if record not in seen:
+                    seen.add(record)
+                    res.append(record)
+        return self.__class__(res, self.context)
+
+    def mapped(self, path):
+        """ values of the dotted field path on the records
+
+        The records reached through relational fields are merged into a
+        browse_record_list, without duplicates.
+        """
+        records = self
+        names = path.split('.')
+        for name in names[:-1]:
+            records = records._mapped(name)
+            if not isinstance(records, browse_record_list):
+                raise BrowseRecordError('Field %s of %s is not relational' % (name, path))
+        return records._mapped(names[-1])
+
+    def filtered(self, func):
+        """ records for which `func` is true
+
+        func is a callable taking a record, a dotted field path, or a
+        search domain evaluated with one search per model.
+        """
+        if isinstance(func, basestring):
+            names = func.split('.')
+            self.mapped(func)
+
+            def test(record):
+                values = [record]
+                for name in names:
+                    res = []
+                    for value in values:
+                        value = value[name]
+                        if isinstance(value, browse_record_list):
+                            res.extend(value)
+                        else:
+                            res.append(value)
+                    values = res
+                return any(values)
+            res = filter(test, self)
+        elif isinstance(func, (list, tuple)):
+            found = set()
+            for records in self._groups():
+                record = records[0]
+                context = dict(record._context, active_test=False)
+                ids = [r._id for r in records]
+                for i in range(0, len(ids), record._cr.IN_MAX):
+                    found.update((record._table_name, id) for id in record._table.search(
+                        record._cr, record._uid, [('id', 'in', ids[i:i+record._cr.IN_MAX])] + list(func),
+                        context=context))
+            res = [record for record in self
+                   if (record._table_name, record._id) in found]
+        else:
+            res = filter(func, self)
+        return self.__class__(res, self.context)
+
+    def sorted(self, key=None, reverse=False):
+        """ records sorted by `key`, a callable or a dotted field path, or
+        in the order of their model when key is None """
+        if key is None:
+            pos = {}
+            for records in self._groups():
+                record = records[0]
+                context = dict(record._context, active_test=False)
+                ids = list(set(r._id for r in records))
+                for i in range(0, len(ids), record._cr.IN_MAX):
+                    for id in record._table.search(record._cr, record._uid,
+                            [('id', 'in', ids[i:i+record._cr.IN_MAX])], context=context):
+                        pos[(record._table_name, id)] = len(pos)
+            res = sorted(self, key=lambda r: pos.get((r._table_name, r._id)), reverse=reverse)
+        elif isinstance(key, basestring):
+            names = key.split('.')
+            for i in range(1, len(names)):
+                self.mapped('.'.join(names[:i]))
+
+            def value(record):
+                for name in names:
+                    record = record[name]
+                return record
+            res = sorted(self, key=value, reverse=reverse)
+        else:
+            res = sorted(self, key=key, reverse=reverse)
+        return self.__class__(res, self.context)
+
+    def read(self, fields=None, load='_classic_read'):
+        """ read() of the records, with one call per model """
+        res = {}
+        for records in self._groups():
+            record = records[0]
+            ids = list(set(r._id for r in records))
+            for data in record._table.read(record._cr, record._uid, ids, fields,
+                                           context=record._context, load=load):
+                res[(record._table_name, data['id'])] = data
+        return [res[(record._table_name, record._id)] for record in self
+                if (record._table_name, record._id) in res]
+
 
 class browse_record(object):
+    __slots__ = ('_list_class', '_cr', '_uid', '_id', '_table', '_table_name',
+                 '_context', '_fields_process', '_data', '_cache')
+
     def __init__(self, cr, uid, id, table, cache, context=None, list_class = None, fields_process={}):
         '''
         table : the object (inherited from orm)
+        cache : a browse_cache (or a dict) shared by the related records
         context : a dictionary with an optional context
         '''
         if not context:
@@ -167,23 +770,24 @@ class browse_record(object):
         self._context = context
         self._fields_process = fields_process
 
-        cache.setdefault(table._name, {})
-        self._data = cache[table._name]
+        data = cache.get(table._name)
+        if data is None:
+            data = cache[table._name] = model_cache()
+        self._data = data
 
         if not (id and isinstance(id, (int, long,))):
             raise BrowseRecordError('Wrong ID for the browse record, got %r, expected an integer.') % (id,)
 #        if not table.exists(cr, uid, id, context):
 #            raise BrowseRecordError(_('Object %s does not exists') % (self,))
 
-        if id not in self._data:
-            self._data[id] = {'id': id}
+        data.add(id)
 
         self._cache = cache
 
     def __getitem__(self, name):
         if name == 'id':
             return self._id
-        if name not in self._data[self._id]:
+        if not self._data.has(self._id, name):
             # build the list of fields we will fetch
 
             # fetch the definition of the field which was asked for
@@ -200,34 +804,47 @@ class browse_record(object):
                 logger.error("Programming error: field '%s' does not exist in object '%s' !" % (name, self._table._name))
                 return False
 
-            # if the field is a classic one or a many2one, we'll fetch all classic and many2one fields
-            if col._prefetch:
-                # gen the list of "local" (ie not inherited) fields which are classic or many2one
-                ffields = filter(lambda x: x[1]._classic_write, self._table._columns.items())
-                # gen the list of inherited fields
-                inherits = map(lambda x: (x[0], x[1][2]), self._table._inherit_fields.items())
-                # complete the field list with the inherited fields which are classic or many2one
-                ffields += filter(lambda x: x[1]._classic_write, inherits)
-            # otherwise we fetch only that field
-            else:
-                ffields = [(name, col)]
-            ids = filter(lambda id: name not in self._data[id], self._data.keys())
+            # the fields fetched together with this one, and the ids of the
+            # cache for which this group of fields has not been fetched yet
+            keys, groups = self._table._get_prefetch_map()
+            key = keys[name]
+            ffields = groups[key]
+            ids = self._data.pending(key)
+            if self._id not in ids:
+                ids.append(self._id)
+            fetched = [(key, ids)]
+            # with declared prefetch groups, the groups already used in this
+            # cache are fetched along for the records which lack them
+            prefetch_groups = self._table._prefetch_groups
+            if prefetch_groups and (key == '_classic' or key in prefetch_groups):
+                ids = ids[:]
+                ids_set = set(ids)
+                ffields = ffields[:]
+                for used in self._data.groups():
+                    if used == key or not (used == '_classic' or used in prefetch_groups):
+                        continue
+                    ids2 = self._data.pending(used)
+                    if not ids2:
+                        continue
+                    fetched.append((used, ids2))
+                    ffields += groups[used]
+                    ids += [id for id in ids2 if id not in ids_set]
+                    ids_set.update(ids2)
             # read the data
             fffields = map(lambda x: x[0], ffields)
-            datas = self._table.read(self._cr, self._uid, ids, fffields, context=self._context, load="_classic_write")
+            try:
+                datas = self._table.read(self._cr, self._uid, ids, fffields, context=self._context, load="_classic_write")
+            except:
+                for used, ids2 in fetched:
+                    self._data.unfetched(used, ids2)
+                raise
+            if config.get('prefetch_stats'):
+                classic = [n for group in groups.values()
+                           for n, f in group if f._classic_write]
+                prefetch_stats.record(self._table_name, key, fffields,
+                                      set(classic).difference(fffields), datas)
             if self._fields_process:
-                lang = self._context.get('lang', 'en_US') or 'en_US'
-                lang_obj_ids = self.pool.get('res.lang').search(self._cr, self._uid,[('code','=',lang)])
-                if not lang_obj_ids:
-                    raise Exception('Language with code "%s" is not defined in your system !\nDefine it through the Administration menu.') % (lang,)
-                lang_obj = self.pool.get('res.lang').browse(self._cr, self._uid,lang_obj_ids[0])
-                for n, f in ffields:
-                    if f._type in self._fields_process:
-                        for d in datas:
-                            d[n] = self._fields_process[f._type](d[n])
-                            if (d[n] is not None) and (d[n] is not False):
-                                d[n].set_value(self._cr, self._uid, d[n], self, f, lang_obj)
-
+                self._process_fields(ffields, datas)
 
             # create browse records for 'remote' objects
             for data in datas:
@@ -273,8 +890,39 @@ class browse_record(object):
                             new_data[n] = browse_null()
                     else:
                         new_data[n] = data[n]
-                self._data[data['id']].update(new_data)
-        return self._data[self._id][name]
+                self._data.update(data['id'], new_data)
+        return self._data.value(self._id, name)
+
+    def _process_fields(self, ffields, datas):
+        """ apply fields_process to the rows read, one field at a time
+
+        The language and the processors of the fields are looked up once
+        per browse cache.
+        """
+        langs = getattr(self._cache, 'langs', {})
+        processors = getattr(self._cache, 'processors', {})
+        key = (self._table_name, tuple([n for n, f in ffields]))
+        todo = processors.get(key)
+        if todo is None:
+            todo = processors[key] = [(n, f, self._fields_process[f._type])
+                                      for n, f in ffields
+                                      if f._type in self._fields_process]
+        if not todo:
+            return
+        lang = self._context.get('lang', 'en_US') or 'en_US'
+        lang_obj = langs.get(lang)
+        if lang_obj is None:
+            lang_pool = self._table.pool.get('res.lang')
+            lang_obj_ids = lang_pool.search(self._cr, self._uid, [('code', '=', lang)])
+            if not lang_obj_ids:
+                raise Exception('Language with code "%s" is not defined in your system !\nDefine it through the Administration menu.' % (lang,))
+            lang_obj = langs[lang] = lang_pool.browse(self._cr, self._uid, lang_obj_ids[0])
+        for n, f, process in todo:
+            values = map(process, [d[n] for d in datas])
+            for d, value in zip(datas, values):
+                if (value is not None) and (value is not False):
+                    value.set_value(self._cr, self._uid, value, self, f, lang_obj)
+                d[n] = value
 
     def __getattr__(self, name):
 #       raise an AttributeError exception.
@@ -378,6 +1026,9 @@ class orm_template(object):
     _rec_name = 'name'
     _parent_name = 'parent_id'
     _parent_store = False
+    # spare positions left at the end of each interval of the nested set, so
+    # that most inserts and moves do not shift the rest of the table
+    _parent_store_gap = 0
     _parent_order = False
     _date_name = 'date'
     _order = 'id'
@@ -386,9 +1037,151 @@ class orm_template(object):
     _inherits = {}
     _table = None
     _invalids = set()
+    _prefetch_groups = {}
+    _prefetch_map = None
+    # read() converts the columns read in one pass, without _read_flat:
+    # the models overriding _read_flat set it to False
+    _read_by_columns = True
+    _column_types = None
+    _static_selections = None
 
     CONCURRENCY_CHECK_FIELD = '__last_update'
 
+    def _get_prefetch_map(self):
+        """ ({field: group key}, {group key: [(name, column), ...]}) used by browse_record
+
+        Accessing a field from a browse_record fetches all the fields of
+        its group: a group declared in _prefetch_groups, the remaining
+        classic and many2one fields, the one2many and many2many fields
+        flagged for prefetch, or the field alone, as the stored fields
+        which are not prefetched (binary, function).
+        """
+        if self._prefetch_map is None:
+            ffields = self._columns.items()
+            ffields += [(n, x[2]) for n, x in self._inherit_fields.items()
+                        if n not in self._columns]
+            declared = {}
+            for key, names in self._prefetch_groups.items():
+                for n in names:
+                    if n not in self._columns and n not in self._inherit_fields:
+                        logger.error("Programming error: prefetch group '%s' of object '%s' refers to the unknown field '%s' !" % (key, self._name, n))
+                    declared[n] = key
+            keys = {}
+            groups = {}
+            for n, f in ffields:
+                if n in declared:
+                    key = declared[n]
+                elif f._classic_write and f._prefetch:
+                    key = '_classic'
+                elif f._prefetch_x2many:
+                    key = '_x2many'
+                else:
+                    key = n
+                keys[n] = key
+                groups.setdefault(key, []).append((n, f))
+            self._prefetch_map = (keys, groups)
+        return self._prefetch_map
+
+    def _inherits_path(self, name):
+        """ names of the models through which the inherited field name is
+        reached, from the direct parent to the model declaring it """
+        res = []
+        model = self
+        while name not in model._columns and name in model._inherit_fields:
+            model = self.pool.get(model._inherit_fields[name][0])
+            res.append(model._name)
+        return res
+
+    def _invalidate_cache(self, cr, ids, fields=None, event='write'):
+        """ Drop the values changed by a write, create or unlink of ids
+        from the browse caches shared by the transaction
+
+        Besides the fields of ids themselves, this drops the inherited
+        fields cached on the children models, the one2many and many2many
+        fields of other models whose content may have changed, the
+        many2one fields pointing to unlinked records and the non stored
+        function fields, which may depend on anything. Unlinked records
+        are forgotten, and so are the cached records of other models
+        deleted along by an ondelete cascade or an _inherits link.
+        """
+        caches = transaction_caches(cr)
+        if not caches:
+            return
+        fields = fields and set(fields) or set()
+        rels = set()
+        for n in fields:
+            f = self._columns.get(n)
+            if f is not None and f._type == 'many2many':
+                rels.add(f._rel)
+        unlinked = event == 'unlink' and set(ids or ()) or set()
+        cascaded = {}
+        for cache in caches:
+            for name, data in cache.items():
+                model = self.pool.get(name)
+                if model is None:
+                    continue
+                keys, groups = model._get_prefetch_map()
+                if name == self._name:
+                    if event == 'unlink':
+                        data.forget(unlinked)
+                    elif fields:
+                        data.invalidate(ids, fields,
+                                        set(keys[n] for n in fields if n in keys))
+                if name != self._name and event != 'unlink':
+                    # the fields inherited from self, directly or not
+                    names = [n for n in fields if n in model._inherit_fields
+                             and self._name in model._inherits_path(n)]
+                    if names:
+                        data.invalidate(None, names, set(keys[n] for n in names))
+                link = model._inherits.get(self._name)
+                stale = []
+                cascade = []
+                nulled = []
+                for key, group in groups.iteritems():
+                    for n, f in group:
+                        if f._properties and not getattr(f, 'store', False):
+                            stale.append(n)
+                        elif f._obj != self._name:
+                            continue
+                        elif f._type == 'one2many':
+                            if event != 'write' or f._fields_id in fields:
+                                stale.append(n)
+                        elif f._type == 'many2many':
+                            if event != 'write' or f._rel in rels:
+                                stale.append(n)
+                        elif f._type in ('many2one', 'one2one') and event == 'unlink':
+                            if n not in model._columns:
+                                stale.append(n)
+                            elif f.ondelete == 'cascade' or n == link:
+                                cascade.append(n)
+                            else:
+                                nulled.append(n)
+                if cascade or nulled:
+                    # the records pointing to the unlinked ones
+                    gone = cascaded.setdefault(name, set())
+                    pointing = set()
+                    for id in data.keys():
+                        for n in cascade + nulled:
+                            value = data.get(id, n)
+                            if isinstance(value, browse_record):
+                                value = value._id
+                            elif isinstance(value, (list, tuple)):
+                                value = value and value[0]
+                            if value not in unlinked:
+                                continue
+                            if n in cascade:
+                                gone.add(id)
+                                break
+                            pointing.add(id)
+                    pointing.difference_update(gone)
+                    if pointing:
+                        data.invalidate(pointing, nulled, set(keys[n] for n in nulled))
+                if stale:
+                    data.invalidate(None, stale, set(keys[n] for n in stale))
+        for name, gone in cascaded.iteritems():
+            if gone:
+                self.pool.get(name)._invalidate_cache(cr, list(gone), event='unlink')
+
     def _field_create(self, cr, context={}):
         cr.execute("SELECT id FROM ir_model WHERE model=%s", (self._name,))
         if not cr.rowcount:
@@ -497,12 +1290,23 @@ class orm_template(object):
             self._description = self._name
         if not self._table:
             self._table = self._name.replace('.', '_')
+        self._init_selections()
+
+    def _init_selections(self):
+        """ precompute the values of the static selections """
+        self._static_selections = dict(
+            (n, frozenset(dict(c.selection))) for n, c in self._columns.items()
+            if isinstance(getattr(c, 'selection', None), (tuple, list)))
 
     def browse(self, cr, uid, select, context=None, list_class=None, fields_process={}):
         if not context:
             context = {}
         self._list_class = list_class or browse_record_list
-        cache = {}
+        cache = None
+        if not (list_class or fields_process):
+            cache = transaction_cache(cr, uid, context)
+        if cache is None:
+            cache = browse_cache()
         # need to accepts ints and longs because ids coming from a method
         # launched by button in the interface have a type long...
         if isinstance(select, (int, long)):
@@ -1012,6 +1816,14 @@ class orm_template(object):
     def create(self, cr, user, vals, context=None):
         raise NotImplementedError('The create method is not implemented on this object !')
 
+    def create_multi(self, cr, user, vals_list, context=None):
+        return [self.create(cr, user, vals, context) for vals in vals_list]
+
+    def write_multi(self, cr, user, values, context=None):
+        for id, vals in values.items():
+            self.write(cr, user, [id], vals, context)
+        return True
+
     # returns the definition of each field in the object
     # the optional fields parameter can limit the result to some fields
     def fields_get_keys(self, cr, user, context=None, read_access=True):
@@ -1026,7 +1838,7 @@ class orm_template(object):
         if context is None:
             context = {}
         res = {}
-        translation_obj = self.pool.get('ir.translation')
+        translations = model_translations(cr, self, context.get('lang', False) or 'en_US')
         for parent in self._inherits:
             res.update(self.pool.get(parent).fields_get(cr, user, fields, context))
 
@@ -1048,20 +1860,15 @@ class orm_template(object):
                         res[f][arg] = getattr(self._columns[f], arg)
 
                 write_groups = self._columns[f].write
-                access_pool = self.pool.get('ir.model.access')
-                access = False
-                for group in write_groups:
-                    access = access or access_pool.check_groups(
-                        cr, user, group
-                    )
-                    if not access and user != 1:
-                        res[f]['readonly'] = True
-                        res[f]['states'] = {}
+                if write_groups and user != 1 and \
+                        not user_in_groups(cr, user, write_groups, self.pool):
+                    res[f]['readonly'] = True
+                    res[f]['states'] = {}
 
-                res_trans = translation_obj._get_source(cr, user, self._name + ',' + f, 'field', context.get('lang', False) or 'en_US', self._columns[f].string)
+                res_trans = translations.get(('field', f, self._columns[f].string))
                 if res_trans:
                     res[f]['string'] = res_trans
-                help_trans = translation_obj._get_source(cr, user, self._name + ',' + f, 'help', context.get('lang', False) or 'en_US')
+                help_trans = translations.get(('help', f, None))
                 if help_trans:
                     res[f]['help'] = help_trans
 
@@ -1073,7 +1880,7 @@ class orm_template(object):
                         for (key, val) in sel:
                             val2 = None
                             if val:
-                                val2 = translation_obj._get_source(cr, user, self._name + ',' + f, 'selection', context.get('lang', False) or 'en_US', val)
+                                val2 = translations.get(('selection', f, val))
                             sel2.append((key, val2 or val))
                         sel = sel2
                         res[f]['selection'] = sel
@@ -1128,9 +1935,10 @@ class orm_template(object):
             fields = self._columns.keys() + self._inherit_fields.keys()
         for lang in langs:
             res[lang] = {'code': lang}
+            translations = model_translations(cr, self, lang)
             for f in fields:
                 if f in self._columns:
-                    res_trans = self.pool.get('ir.translation')._get_source(cr, uid, self._name+','+f, 'field', lang)
+                    res_trans = translations.get(('field', f, None))
                     if res_trans:
                         res[lang][f] = res_trans
                     else:
@@ -1152,6 +1960,7 @@ class orm_template(object):
                 if field in self._columns:
                     src = self._columns[field].string
                     self.pool.get('ir.translation')._set_ids(cr, uid, self._name+','+field, 'field', lang, [0], vals[field], src)
+        invalidate_translations(cr)
         for table in self._inherits:
             cols = intersect(self._inherit_fields.keys(), vals)
             if cols:
@@ -1235,6 +2044,7 @@ class orm_memory(orm_template):
             self.datas[id_new]['internal.date_access'] = time.time()
             for field in upd_todo:
                 self._columns[field].set_memory(cr, self, id_new, field, vals[field], user, context)
+        self._invalidate_cache(cr, ids, vals.keys())
         self._validate(cr, user, [id_new], context)
         # TODO: Check in ERP workflow is created
         #wf_service = netsvc.LocalService("workflow")
@@ -1271,6 +2081,7 @@ class orm_memory(orm_template):
 
         for field in upd_todo:
             self._columns[field].set_memory(cr, self, id_new, field, vals[field], user, context)
+        self._invalidate_cache(cr, [id_new], vals.keys(), event='create')
         self._validate(cr, user, [id_new], context)
         # TODO: Check in OpenERP is called
         #wf_service = netsvc.LocalService("workflow")
@@ -1342,6 +2153,7 @@ class orm_memory(orm_template):
         for id in ids:
             if id in self.datas:
                 del self.datas[id]
+        self._invalidate_cache(cr, ids, event='unlink')
         if ids:
             cr.execute('delete from wkf_instance where res_type=%s and res_id in %s', (self._name, tuple(ids)))
         return True
@@ -1371,44 +2183,48 @@ class orm(orm_template):
     _protected = ['read','write','create','default_get','perm_read','unlink','fields_get','fields_view_get','search','name_get','distinct_field_get','name_search','copy','import_data','search_count', 'exists']
 
     def _parent_store_compute(self, cr):
+        """ number the nested set from the (id, parent) pairs read in one
+        query, without recursion, and write the intervals that changed in
+        bulk """
         if not self._parent_store:
             return
         logger.info('Computing parent left and right for table %s...' % (self._table, ))
-        def browse_rec(root, pos=0):
-# TODO: set order
-            where = self._parent_name+'='+str(root)
-            if not root:
-                where = self._parent_name+' IS NULL'
-            if self._parent_order:
-                where += ' order by '+self._parent_order
-            cr.execute('SELECT id FROM '+self._table+' WHERE '+where)
-            pos2 = pos + 1
-            childs = cr.fetchall()
-            for id in childs:
-                pos2 = browse_rec(id[0], pos2)
-            cr.execute('update '+self._table+' set parent_left=%s, parent_right=%s where id=%s', (pos,pos2,root))
-            return pos2+1
-        query = 'SELECT id FROM '+self._table+' WHERE '+self._parent_name+' IS NULL'
-        if self._parent_order:
-            query += ' order by '+self._parent_order
-        pos = 0
-        cr.execute(query)
-        for (root,) in cr.fetchall():
-            pos = browse_rec(root, pos)
+        cr.execute('SELECT id, %s FROM "%s" ORDER BY %s' % (
+            self._parent_name, self._table, self._parent_order or 'id'))
+        rows = cr.fetchall()
+        if self._parent_store == 'path':
+            paths = materialized_paths([row[0] for row in rows], [row[1] for row in rows])
+            bulk_update(cr, self._table, [('parent_path', 'integer[]')],
+                        ((row[0], path) for row, path in zip(rows, paths) if path is not None),
+                        changed_only=True)
+            return True
+        ids = array.array('l', [row[0] for row in rows])
+        left, right = nested_intervals(ids, [row[1] for row in rows], self._parent_store_gap)
+        del rows
+        bulk_update(cr, self._table, [('parent_left', 'integer'), ('parent_right', 'integer')],
+                    ((ids[i], left[i], right[i]) for i in xrange(len(ids)) if left[i] >= 0),
+                    changed_only=True)
         return True
 
     def _update_store(self, cr, f, k):
+        """ compute and store the values of the function field k of all the
+        records, by chunks sized to take config['store_chunk_time']
+        seconds each """
         logger.info("storing computed values of fields.function '%s'" % (k,))
-        ss = self._columns[k]._symbol_set
-        update_query = 'UPDATE "%s" SET "%s"=%s WHERE id=%%s' % (self._table, k, ss[0])
         cr.execute('select id from '+self._table)
         ids_lst = map(lambda x: x[0], cr.fetchall())
-        logger.info("storing computed values for %s objects" % len(ids_lst))
-        start = datetime.datetime.now()
-        while ids_lst:
-            iids = ids_lst[:40]
-            ids_lst = ids_lst[40:]
+        total = len(ids_lst)
+        logger.info("storing computed values for %s objects" % total)
+        target = config.get('store_chunk_time', 1.0)
+        largest = config.get('store_chunk_max', 50000)
+        size = 40
+        done = 0
+        start = logged = time.time()
+        while done < total:
+            iids = ids_lst[done:done+size]
+            chunk_start = time.time()
             res = f.get(cr, self, iids, k, 1, {})
+            rows = []
             for key,val in res.items():
                 if f._multi:
                     val = val[k]
@@ -1416,10 +2232,23 @@ class orm(orm_template):
                 if type(val)==tuple:
                     val = val[0]
                 if (val<>False) or (type(val)<>bool):
-                    cr.execute(update_query, (ss[1](val), key))
-        end  = datetime.datetime.now()
-        logger.info("stored in %.3fs" % ((end - start).seconds +
-                 float((end - start).microseconds) / 10**6))
+                    rows.append([key, val])
+            if rows:
+                self._write_computed(cr, [k], rows)
+            done += len(iids)
+            now = time.time()
+            # the next chunk is sized on the time taken by this one
+            elapsed = now - chunk_start
+            if elapsed > 0:
+                size = int(size * target / elapsed)
+            else:
+                size *= 4
+            size = max(1, min(size, len(iids) * 4, largest))
+            if now - logged >= 10 or done >= total:
+                logged = now
+                logger.info("stored %d/%d values of '%s' (%.0f/s)" % (
+                    done, total, k, done / max(now - start, 0.001)))
+        logger.info("stored in %.3fs" % (time.time() - start,))
 
     def _check_removed_columns(self, cr, log=False):
         # iterate on the database columns to drop the NOT NULL constraints
@@ -1444,13 +2273,25 @@ class orm(orm_template):
         store_compute = False
         create = False
         todo_end = []
+        self._column_types = None
         self._field_create(cr, context=context)
         if not hasattr(self, "_auto") or self._auto:
             cr.execute("SELECT relname FROM pg_class WHERE relkind in ('r','v') AND relname=%s", (self._table,))
             if not cr.rowcount:
                 cr.execute('CREATE TABLE "%s" (id SERIAL NOT NULL, PRIMARY KEY(id)) WITH OIDS' % (self._table,))
                 create = True
-            if self._parent_store:
+            if self._parent_store == 'path':
+                cr.execute("""SELECT c.relname
+                    FROM pg_class c, pg_attribute a
+                    WHERE c.relname=%s AND a.attname=%s AND c.oid=a.attrelid
+                    """, (self._table, 'parent_path'))
+                if not cr.rowcount:
+                    if self._columns[self._parent_name].ondelete != 'cascade':
+                        logger.error("The column %s on object %s must be set as ondelete='cascade'" % (self._parent_name, self._name))
+                    cr.execute('ALTER TABLE "%s" ADD COLUMN "parent_path" INTEGER[]' % (self._table,))
+                    cr.execute('CREATE INDEX "%s_parent_path_index" ON "%s" USING gin ("parent_path")' % (self._table, self._table))
+                    store_compute = True
+            elif self._parent_store:
                 cr.execute("""SELECT c.relname
                     FROM pg_class c, pg_attribute a
                     WHERE c.relname=%s AND a.attname=%s AND c.oid=a.attrelid
@@ -1866,6 +2707,7 @@ class orm(orm_template):
             assert (k in self._columns) or (k in self._inherit_fields), 'Default function defined in %s but field %s does not exist !' % (self._name, k,)
         for f in self._columns:
             self._columns[f].restart()
+        self._init_selections()
 
     def default_get(self, cr, uid, fields_list, context=None):
         if not context:
@@ -1964,6 +2806,7 @@ class orm(orm_template):
             for col in self.pool.get(table)._inherit_fields.keys():
                 res[col] = (table, self._inherits[table], self.pool.get(table)._inherit_fields[col][2])
         self._inherit_fields = res
+        self._prefetch_map = None
         self._inherits_reload_src()
 
     def fields_get(self, cr, user, fields=None, context=None):
@@ -1974,10 +2817,14 @@ class orm(orm_template):
 
     def sorted_read(self, cursor, user, ids, fields=None, context=None,
                     load='_classic_read'):
-        res = self.read(cursor, user, ids, fields, context, load)
-        return sorted(res, key=lambda x: ids.index(x['id']))
-
-    def read(self, cr, user, ids, fields=None, context=None, load='_classic_read'):
+        res = dict((x['id'], x) for x in self.read(cursor, user, ids, fields, context, load))
+        # each record once, at the position of its first id
+        return [res.pop(id) for id in ids if id in res]
+
+    def read(self, cr, user, ids, fields=None, context=None, load='_classic_read',
+             preserve_order=False):
+        """ With preserve_order the records are returned in the order of
+        ids, each one once, instead of the order of the model """
         if not context:
             context = {}
         self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
@@ -1986,40 +2833,221 @@ class orm(orm_template):
         select = ids
         if isinstance(ids, (int, long)):
             select = [ids]
-        result = self._read_flat(cr, user, select, fields, context, load)
+        if self._read_by_columns:
+            columns = self._read_columns(cr, user, select, fields, context, load, preserve_order)[1]
+            names = columns.keys()
+            self._normalize_columns(cr, columns, self._reference_fields(names))
+            result = [dict(itertools.izip(names, row))
+                      for row in itertools.izip(*[columns[n] for n in names])]
+            if isinstance(ids, (int, long)):
+                return result and result[0] or False
+            return result
 
+        if preserve_order:
+            result = self._read_flat(cr, user, select, fields, context, load, preserve_order=True)
+        else:
+            result = self._read_flat(cr, user, select, fields, context, load)
+
+        references = []
+        for key in set(fields):
+            if key in self._columns:
+                type = self._columns[key]._type
+            elif key in self._inherit_fields:
+                type = self._inherit_fields[key][2]._type
+            else:
+                continue
+            if type == 'reference':
+                references.append(key)
+        values = set()
         for r in result:
             for key, v in r.items():
                 if v is None:
                     r[key] = False
-                if key in self._columns.keys():
-                    type = self._columns[key]._type
-                elif key in self._inherit_fields.keys():
-                    type = self._inherit_fields[key][2]._type
-                else:
-                    continue
-                if type == 'reference' and v:
-                    model,ref_id = v.split(',')
-                    table = self.pool.get(model)._table
-                    cr.execute('select id from "%s" where id=%%s' % (table,), (ref_id,))
-                    id_exist = cr.fetchone()
-                    if not id_exist:
-                        query = 'UPDATE "%s" SET "%s"=NULL WHERE "%s"=%%s' % (self._table, key, key)
-                        cr.execute(query, (v,))
+            for key in references:
+                if r.get(key):
+                    values.add(r[key])
+        if values:
+            # dangling references read as empty, see repair_references()
+            existing = self._existing_references(cr, values)
+            for r in result:
+                for key in references:
+                    if r.get(key) and r[key] not in existing:
                         r[key] = ''
 
         if isinstance(ids, (int, long)):
             return result and result[0] or False
         return result
 
-    def _read_flat(self, cr, user, ids, fields_to_read, context=None, load='_classic_read'):
+    def _existing_references(self, cr, values):
+        """ the values of reference fields ('model,id') whose record exists,
+        checked with one query per model """
+        todo = {}
+        for v in values:
+            model, _, ref_id = v.partition(',')
+            try:
+                todo.setdefault(model, set()).add(int(ref_id))
+            except ValueError:
+                continue
+        res = set()
+        for model, ref_ids in todo.items():
+            obj = self.pool.get(model)
+            if obj is None:
+                continue
+            cr.execute('SELECT id FROM "%s" WHERE id = ANY(%%s)' % (obj._table,), (list(ref_ids),))
+            res.update('%s,%s' % (model, x[0]) for x in cr.fetchall())
+        return res
+
+    def repair_references(self, cr, uid, fields=None, context=None):
+        """ set to NULL the stored reference fields pointing to records which
+        do not exist anymore, returns the number of rows updated """
+        count = 0
+        for key, col in self._columns.items():
+            if col._type != 'reference' or not col._classic_write \
+                    or (fields and key not in fields):
+                continue
+            cr.execute('SELECT DISTINCT "%s" FROM "%s" WHERE "%s" IS NOT NULL' % (key, self._table, key))
+            values = set(x[0] for x in cr.fetchall() if x[0])
+            dangling = list(values - self._existing_references(cr, values))
+            if dangling:
+                cr.execute('UPDATE "%s" SET "%s"=NULL WHERE "%s" = ANY(%%s)' % (self._table, key, key), (dangling,))
+                count += cr.rowcount
+                self._invalidate_cache(cr, None, [key])
+        return count
+
+    def read_columns(self, cr, user, ids, fields=None, context=None,
+                     load='_classic_read', container='array', preserve_order=False):
+        """ read() returning {field: values} instead of one dict per record
+
+        The values of each field are in the order of the ids in 'id'. With
+        container 'array' (or 'numpy', when installed) the integer, float
+        and boolean fields, and the many2one fields read with
+        load='_classic_write', are returned as arrays, NULL being 0.
+        """
+        if not context:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
+        if not fields:
+            fields = self._columns.keys() + self._inherit_fields.keys()
+        ids, columns = self._read_columns(cr, user, ids, fields, context, load, preserve_order)
+        self._normalize_columns(cr, columns, self._reference_fields(columns.keys()))
+        if container != 'list':
+            for key, values in columns.items():
+                f = self._columns.get(key) or \
+                    (key in self._inherit_fields and self._inherit_fields[key][2])
+                if not f:
+                    continue
+                array_type = _array_types.get(f._type)
+                if f._type in ('many2one', 'one2one') and load != '_classic_write':
+                    array_type = None
+                if array_type:
+                    columns[key] = _make_array(array_type, values, container)
+        columns['id'] = _make_array('l', ids, container)
+        return columns
+
+    def read_tuples(self, cr, user, ids, fields, context=None, load='_classic_read',
+                    preserve_order=False):
+        """ read() returning a tuple (id, values of fields...) per record """
+        columns = self.read_columns(cr, user, ids, fields, context, load, 'list', preserve_order)
+        return zip(columns['id'], *[columns[f] for f in fields])
+
+    def _read_flat(self, cr, user, ids, fields_to_read, context=None, load='_classic_read',
+                   preserve_order=False):
+        ids, columns = self._read_columns(cr, user, ids, fields_to_read, context, load, preserve_order)
+        names = columns.keys()
+        return [dict(itertools.izip(names, row))
+                for row in itertools.izip(*[columns[n] for n in names])]
+
+    def _reference_fields(self, names):
+        """ the reference fields among names """
+        references = []
+        for n in names:
+            f = self._columns.get(n) or \
+                (n in self._inherit_fields and self._inherit_fields[n][2])
+            if f and f._type == 'reference':
+                references.append(n)
+        return references
+
+    def _normalize_columns(self, cr, columns, references):
+        """ NULL read as False and dangling references as '', in place """
+        for key, values in columns.items():
+            if None in values:
+                columns[key] = [False if v is None else v for v in values]
+        for key in references:
+            values = columns[key]
+            existing = self._existing_references(cr, set(filter(None, values)))
+            columns[key] = ['' if v and v not in existing else v for v in values]
+
+    def _getter(self, name, ids, arg, user, context, values=None):
+        """ function of a cursor computing the field name (arg for _multi
+        fields) of ids """
+        column = self._columns[name]
+        return lambda cr: column.get(cr, self, ids, arg, user, context=context, values=values)
+
+    def _compute_getters(self, cr, getters):
+        """ results of the [(fields, getter)], the function fields computed
+        concurrently when the cursor has an executor, see ooda.executor """
+        done = {}
+        executor = get_executor(cr)
+        if executor:
+            functions = [i for i, (val, getter) in enumerate(getters)
+                         if isinstance(self._columns[val[0]], fields.function)]
+            if len(functions) > 1:
+                done = dict(zip(functions, executor.map(cr, [getters[i][1] for i in functions])))
+        return [done[i] if i in done else getter(cr)
+                for i, (val, getter) in enumerate(getters)]
+
+    def _inherits_joins(self, fields_to_read, load, context=None):
+        """ ({field: parent model}, [(child model, parent model)]) of the
+        inherited fields selected through a JOIN on the _inherits foreign
+        keys: the stored, untranslated fields whose tables are joined once """
+        # the lazy binary handles are built by the read of their parents
+        lazy = context and context.get('bin_lazy') and not context.get('bin_size')
+        joined = {}
+        joins = []
+        tables = set([self._table])
+        for f in fields_to_read:
+            if f in self._columns or f not in self._inherit_fields:
+                continue
+            path = []
+            model = self
+            while model is not None and f not in model._columns:
+                if f not in model._inherit_fields:
+                    model = None
+                    break
+                parent = self.pool.get(model._inherit_fields[f][0])
+                path.append((model, parent))
+                model = parent
+            if model is None:
+                continue
+            col = model._columns[f]
+            if not (col._classic_write and getattr(col, load)) or col.translate:
+                continue
+            if lazy and isinstance(col, fields.binary):
+                continue
+            todo = [hop for hop in path if hop not in joins]
+            if [hop for hop in todo if hop[1]._table in tables]:
+                continue
+            for hop in todo:
+                joins.append(hop)
+                tables.add(hop[1]._table)
+            joined[f] = model
+        return joined, joins
+
+    def _read_columns(self, cr, user, ids, fields_to_read, context=None, load='_classic_read',
+                      preserve_order=False):
+        """ ids read, in the order of the table (of ids with preserve_order),
+        and {field: values} in the same order, 'id' included """
         if not context:
             context = {}
         if not ids:
-            return []
+            return [], {'id': []}
+        if preserve_order:
+            seen = set()
+            ids = [id for id in ids if not (id in seen or seen.add(id))]
 
         if fields_to_read == None:
             fields_to_read = self._columns.keys()
+        self._flush_recompute(cr, fields_to_read)
 
         # construct a clause for the rules :
         d1, d2 = self.pool.get('ir.rule').domain_get(cr, user, self._name)
@@ -2030,158 +3058,171 @@ class orm(orm_template):
                         or (f in self._columns and getattr(self._columns[f], '_classic_write'))
                      ] + self._inherits.values()
 
-        res = []
+        # the stored inherited fields are selected through a join on the
+        # parent tables, checking their rules in the same query
+        order_by = self._parent_order or self._order
+        joined, joins = self._inherits_joins(fields_to_read, load, context)
+        if preserve_order:
+            order_by = '_ids.pos'
+        elif joins:
+            order_by = _qualify_order(order_by, self._table,
+                    self._columns.keys() + ['id', 'create_uid', 'create_date', 'write_uid', 'write_date'])
+            if not order_by:
+                order_by = self._parent_order or self._order
+                joined, joins = {}, []
+
         if len(fields_pre):
-            def convert_field(f):
+            def convert_field(f, table):
                 if f in ('create_date', 'write_date'):
-                    return "date_trunc('second', %s) as %s" % (f, f)
+                    return "date_trunc('second', \"%s\".%s) as %s" % (table, f, f)
                 if f == self.CONCURRENCY_CHECK_FIELD:
                     if self._log_access:
-                        return "COALESCE(write_date, create_date, now())::timestamp AS %s" % (f,)
+                        return "COALESCE(\"%s\".write_date, \"%s\".create_date, now())::timestamp AS %s" % (table, table, f)
                     return "now()::timestamp AS %s" % (f,)
-                if isinstance(self._columns[f], fields.binary) and context.get('bin_size', False):
-                    return 'length("%s") as "%s"' % (f, f)
-                return '"%s"' % (f,)
-            fields_pre2 = map(convert_field, fields_pre)
-            order_by = self._parent_order or self._order
-
-            select_fields = ','.join(fields_pre2 + ['id'])
-            query = 'SELECT %s FROM "%s" WHERE id in %%s' % (select_fields, self._table)
-            if d1:
-                query += " AND " + d1
+                col = table == self._table and self._columns[f] or joined[f]._columns[f]
+                if isinstance(col, fields.binary) and (context.get('bin_size', False) or context.get('bin_lazy', False)):
+                    return 'length("%s"."%s") as "%s"' % (table, f, f)
+                return '"%s"."%s"' % (table, f)
+            fields_pre2 = [convert_field(f, self._table) for f in fields_pre]
+            fields_pre2 += [convert_field(f, joined[f]._table) for f in joined]
+            from_clause = '"%s"' % (self._table,)
+            if preserve_order:
+                # rows in the order of the ids, sorted on their position
+                from_clause += ' JOIN unnest(%%s) WITH ORDINALITY AS _ids(id, pos) ON ("%s".id = _ids.id)' % (self._table,)
+            select_params = []
+            rules = []
+            for child, parent in joins:
+                from_clause += ' LEFT JOIN "%s" ON ("%s".id = "%s"."%s")' % (
+                    parent._table, parent._table, child._table, child._inherits[parent._name])
+                self.pool.get('ir.model.access').check(cr, user, parent._name, 'read', context=context)
+                pd1, pd2 = self.pool.get('ir.rule').domain_get(cr, user, parent._name)
+                if pd1:
+                    # NULL when there is no parent
+                    fields_pre2.append('("%s".id IS NULL OR (%s))' % (parent._table, pd1))
+                    select_params += pd2
+                    rules.append(parent)
+
+            select_fields = ','.join(fields_pre2 + ['"%s".id' % (self._table,)])
+            if preserve_order:
+                query = 'SELECT %s FROM %s' % (select_fields, from_clause)
+                if d1:
+                    query += " WHERE " + d1
+            else:
+                query = 'SELECT %s FROM %s WHERE "%s".id in %%s' % (select_fields, from_clause, self._table)
+                if d1:
+                    query += " AND " + d1
             query += " ORDER BY " + order_by
 
+            rows = []
             for i in range(0, len(ids), cr.IN_MAX):
                 sub_ids = ids[i:i+cr.IN_MAX]
+                param = preserve_order and list(sub_ids) or tuple(sub_ids)
                 if d1:
-                    cr.execute(query, [tuple(sub_ids)] + d2)
+                    cr.execute(query, select_params + [param] + d2)
                     if cr.rowcount != len(set(sub_ids)):
                         raise AccessError('AccessError',
-                                'You try to bypass an access rule (Document type: %s).') % self._description
+                                'You try to bypass an access rule (Document type: %s).' % self._description)
                 else:
-                    cr.execute(query, (tuple(sub_ids),))
-                res.extend(cr.dictfetchall())
+                    cr.execute(query, select_params + [param])
+                rows.extend(cr.fetchall())
+            names = fields_pre + joined.keys() + ['_rule_%d' % i for i in range(len(rules))] + ['id']
+            if rows:
+                columns = dict(zip(names, map(list, zip(*rows))))
+            else:
+                columns = dict((n, []) for n in names)
+            for i, parent in enumerate(rules):
+                if not all(columns.pop('_rule_%d' % i)):
+                    raise AccessError('AccessError',
+                            'You try to bypass an access rule (Document type: %s).' % parent._description)
         else:
-            res = map(lambda x: {'id': x}, ids)
-        
-#        if not res:
-#            res = map(lambda x: {'id': x}, ids)
-#            for record in res:
-#                for f in fields_to_read:
-#                    field_val = False
-#                    if f in self._columns.keys():
-#                        ftype = self._columns[f]._type
-#                    elif f in self._inherit_fields.keys():
-#                        ftype = self._inherit_fields[f][2]._type
-#                    else:
-#                        continue
-#                    if ftype in ('one2many', 'many2many'):
-#                        field_val = []
-#                    record.update({f:field_val})
-        
-        for f in fields_pre:
-            if f == self.CONCURRENCY_CHECK_FIELD:
-                continue
-            if self._columns[f].translate:
-                ids = map(lambda x: x['id'], res)
-                res_trans = self.pool.get('ir.translation')._get_ids(cr, user, self._name+','+f, 'model', context.get('lang', False) or 'en_US', ids)
-                for r in res:
-                    r[f] = res_trans.get(r['id'], False) or r[f]
-
+            columns = {'id': list(ids)}
+        ids = columns['id']
+
+        if context.get('bin_lazy', False) and not context.get('bin_size', False):
+            # handles reading the content on demand, from the sizes
+            for f in fields_pre:
+                if f in self._columns and isinstance(self._columns[f], fields.binary):
+                    columns[f] = [fields.binary_handle(cr, self._table, f, id, size)
+                                  if size is not None else False
+                                  for id, size in zip(ids, columns[f])]
+
+        translated = [f for f in fields_pre if f != self.CONCURRENCY_CHECK_FIELD
+                      and self._columns[f].translate]
+        if translated:
+            res_trans = read_translations(cr, self, translated, context.get('lang', False) or 'en_US', ids)
+            for f in translated:
+                columns[f] = [res_trans.get((f, id)) or value
+                              for id, value in zip(ids, columns[f])]
+
+        for f, model in joined.items():
+            col = model._columns[f]
+            if col._symbol_get:
+                columns[f] = map(col._symbol_get, columns[f])
+            if col.read and not user_in_groups(cr, user, col.read, self.pool):
+                columns[f] = map(_no_permission, columns[f])
+
+        # the other inherited fields are read on the parents
+        inherited = [f for f in fields_to_read
+                     if f not in self._columns and f in self._inherit_fields]
         for table in self._inherits:
+            if not inherited:
+                break
             col = self._inherits[table]
-            cols = intersect(self._inherit_fields.keys(), fields_to_read)
-            if not cols:
-                continue
-            res2 = self.pool.get(table).read(cr, user, [x[col] for x in res], cols, context, load)
-
-            res3 = {}
-            for r in res2:
-                res3[r['id']] = r
-                del r['id']
-
-            for record in res:
-                if not record[col]:# if the record is deleted from _inherits table?
-                    continue
-                record.update(res3[record[col]])
-                if col not in fields_to_read:
-                    del record[col]
+            cols = [f for f in inherited
+                    if f not in joined and self._inherit_fields[f][0] == table]
+            if cols:
+                parent_ids = columns[col]
+                res2 = self.pool.get(table).read(cr, user, filter(None, parent_ids), cols, context, load)
+                res3 = dict((r['id'], r) for r in res2)
+                # records whose parent is deleted get False
+                rows = [res3.get(id, {}) for id in parent_ids]
+                for f in cols:
+                    columns[f] = [r.get(f, False) for r in rows]
+            if col not in fields_to_read:
+                del columns[col]
 
         # all fields which need to be post-processed by a simple function (symbol_get)
-        fields_post = filter(lambda x: x in self._columns and self._columns[x]._symbol_get, fields_to_read)
-        if fields_post:
-            # maybe it would be faster to iterate on the fields then on res, so that we wouldn't need
-            # to get the _symbol_get in each occurence
-            for r in res:
-                for f in fields_post:
-                    r[f] = self._columns[f]._symbol_get(r[f])
-        ids = map(lambda x: x['id'], res)
+        for f in fields_to_read:
+            if f in self._columns and self._columns[f]._symbol_get and f in columns:
+                columns[f] = map(self._columns[f]._symbol_get, columns[f])
 
         # all non inherited fields for which the attribute whose name is in load is False
         fields_post = filter(lambda x: x in self._columns and not getattr(self._columns[x], load), fields_to_read)
 
         # Compute POST fields
         todo = {}
+        keys = []
         for f in fields_post:
+            if self._columns[f]._multi not in todo:
+                keys.append(self._columns[f]._multi)
             todo.setdefault(self._columns[f]._multi, [])
             todo[self._columns[f]._multi].append(f)
-        for key,val in todo.items():
+        getters = []
+        for key in keys:
+            val = todo[key]
+            # the values already read, as needed by the many2one getters
+            names = [n for n in val if n in columns]
+            values = [dict(zip(names, row), id=id)
+                      for id, row in zip(ids, zip(*[columns[n] for n in names]))]
             if key:
-                res2 = self._columns[val[0]].get(cr, self, ids, val, user, context=context, values=res)
-                for pos in val:
-                    for record in res:
-                        record[pos] = res2[record['id']][pos]
+                getters.append((val, self._getter(val[0], ids, val, user, context, values)))
             else:
                 for f in val:
-                    res2 = self._columns[f].get(cr, self, ids, f, user, context=context, values=res)
-                    for record in res:
-                        if res2 and (record['id'] in res2):
-                            record[f] = res2[record['id']]
-                        else:
-                            record[f] = []
-
-#for f in fields_post:
-#    # get the value of that field for all records/ids
-#    res2 = self._columns[f].get(cr, self, ids, f, user, context=context, values=res)
-#    for record in res:
-#        record[f] = res2[record['id']]
-
-        readonly = None
-        for vals in res:
-            for field in vals.copy():
-                fobj = None
-                if field in self._columns:
-                    fobj = self._columns[field]
+                    getters.append(([f], self._getter(f, ids, f, user, context, values)))
+        for (val, getter), res2 in zip(getters, self._compute_getters(cr, getters)):
+            if self._columns[val[0]]._multi:
+                for pos in val:
+                    columns[pos] = [res2[id][pos] for id in ids]
+            else:
+                res2 = res2 or {}
+                columns[val[0]] = [res2.get(id, []) for id in ids]
 
-                if not fobj:
-                    continue
-                groups = fobj.read
-                if groups:
-                    edit = False
-                    for group in groups:
-                        module = group.split(".")[0]
-                        grp = group.split(".")[1]
-                        cr.execute("select count(*) from res_groups_users_rel where gid in (select res_id from ir_model_data where name=%s and module=%s and model=%s) and uid=%s", \
-                                   (grp, module, 'res.groups', user))
-                        readonly = cr.fetchall()
-                        if readonly[0][0] >= 1:
-                            edit = True
-                            break
-                        elif readonly[0][0] == 0:
-                            edit = False
-                        else:
-                            edit = False
-
-                    if not edit:
-                        if type(vals[field]) == type([]):
-                            vals[field] = []
-                        elif type(vals[field]) == type(0.0):
-                            vals[field] = 0
-                        elif type(vals[field]) == type(''):
-                            vals[field] = '=No Permission='
-                        else:
-                            vals[field] = False
-        return res
+        # fields restricted to some groups, checked once per field
+        for field, values in columns.items():
+            fobj = self._columns.get(field)
+            if fobj and fobj.read and not user_in_groups(cr, user, fobj.read, self.pool):
+                columns[field] = map(_no_permission, values)
+        return ids, columns
 
     def perm_read(self, cr, user, ids, context=None, details=True):
         if not context:
@@ -2267,6 +3308,11 @@ class orm(orm_template):
                 cr.execute('DELETE' + from_where, [tuple(sub_ids)] + d2)
             else:
                 cr.execute('DELETE' + from_where, (tuple(sub_ids),))
+        self._invalidate_cache(cr, ids, event='unlink')
+        if self._name in _group_models:
+            invalidate_user_groups(cr)
+        elif self._name == 'ir.translation':
+            invalidate_translations(cr)
 
         for order, object, store_ids, fields in result_store:
             if object != self._name:
@@ -2281,7 +3327,6 @@ class orm(orm_template):
     # TODO: Validate
     #
     def write(self, cr, user, ids, vals, context=None):
-        readonly = None
         for field in vals.copy():
             fobj = None
             if field in self._columns:
@@ -2290,26 +3335,8 @@ class orm(orm_template):
                 fobj = self._inherit_fields[field][2]
             if not fobj:
                 continue
-            groups = fobj.write
-
-            if groups:
-                edit = False
-                for group in groups:
-                    module = group.split(".")[0]
-                    grp = group.split(".")[1]
-                    cr.execute("select count(*) from res_groups_users_rel where gid in (select res_id from ir_model_data where name=%s and module=%s and model=%s) and uid=%s", \
-                               (grp, module, 'res.groups', user))
-                    readonly = cr.fetchall()
-                    if readonly[0][0] >= 1:
-                        edit = True
-                        break
-                    elif readonly[0][0] == 0:
-                        edit = False
-                    else:
-                        edit = False
-
-                if not edit:
-                    vals.pop(field)
+            if fobj.write and not user_in_groups(cr, user, fobj.write, self.pool):
+                vals.pop(field)
 
 
         if not context:
@@ -2326,6 +3353,7 @@ class orm(orm_template):
         # No direct update of parent_left/right
         vals.pop('parent_left', None)
         vals.pop('parent_right', None)
+        vals.pop('parent_path', None)
 
         parents_changed = []
         if self._parent_store and (self._parent_name in vals):
@@ -2348,11 +3376,14 @@ class orm(orm_template):
         upd_todo = []
         updend = []
         direct = []
+        streams = []
         totranslate = context.get('lang', False) and (context['lang'] != 'en_US')
         for field in vals:
             if field in self._columns:
                 if self._columns[field]._classic_write and not (hasattr(self._columns[field], '_fnct_inv')):
-                    if (not totranslate) or not self._columns[field].translate:
+                    if isinstance(self._columns[field], fields.binary) and fields.is_stream(vals[field]):
+                        streams.append(field)
+                    elif (not totranslate) or not self._columns[field].translate:
                         upd0.append('"'+field+'"='+self._columns[field]._symbol_set[0])
                         upd1.append(self._columns[field]._symbol_set[1](vals[field]))
                     direct.append(field)
@@ -2360,31 +3391,14 @@ class orm(orm_template):
                     upd_todo.append(field)
             else:
                 updend.append(field)
-            if field in self._columns \
-                    and hasattr(self._columns[field], 'selection') \
-                    and vals[field]:
-                if self._columns[field]._type == 'reference':
-                    val = vals[field].split(',')[0]
-                else:
-                    val = vals[field]
-                if isinstance(self._columns[field].selection, (tuple, list)):
-                    if val not in dict(self._columns[field].selection):
-                        raise except_orm(_('ValidateError'),
-                        _('The value "%s" for the field "%s" is not in the selection') \
-                                % (vals[field], field))
-                else:
-                    if val not in dict(self._columns[field].selection(
-                        self, cr, user, context=context)):
-                        raise ValidateException('ValidateError',
-                        'The value "%s" for the field "%s" is not in the selection' \
-                                % (vals[field], field))
+            self._check_selection(cr, user, field, vals[field], context)
 
         if self._log_access:
             upd0.append('write_uid=%s')
             upd0.append('write_date=now()')
             upd1.append(user)
 
-        if upd0:
+        if upd0 or streams:
 
             clause = " WHERE id IN %s"
             d1, d2 = self.pool.get('ir.rule').domain_get(cr, user, self._name)
@@ -2403,7 +3417,8 @@ class orm(orm_template):
                                 'You try to bypass an access rule (Document type: %s).' % \
                                         self._description)
 
-                    cr.execute(update_query, upd1 + [tuple(sub_ids)] + d2)
+                    if upd0:
+                        cr.execute(update_query, upd1 + [tuple(sub_ids)] + d2)
                 else:
                     cr.execute(select_query, (tuple(sub_ids),))
                     if cr.rowcount != len(sub_ids):
@@ -2411,7 +3426,12 @@ class orm(orm_template):
                                 'You try to write on an record that doesn\'t exist ' \
                                         '(Document type: %s).' % self._description)
 
-                    cr.execute(update_query, upd1 + [tuple(sub_ids)])
+                    if upd0:
+                        cr.execute(update_query, upd1 + [tuple(sub_ids)])
+
+            # file-like objects are written in chunks
+            for f in streams:
+                self._columns[f].set_stream(cr, self, ids, f, vals[f])
 
             if totranslate:
                 for f in direct:
@@ -2422,7 +3442,7 @@ class orm(orm_template):
                             # Inserting value to DB
                             self.write(cr, user, ids, {f:vals[f]})
                         self.pool.get('ir.translation')._set_ids(cr, user, self._name+','+f, 'model', context['lang'], ids, vals[f], src_trans)
-
+            self._invalidate_cache(cr, ids, direct + ['write_uid', 'write_date'])
 
         # call the 'set' method of fields which are not classic_write
         upd_todo.sort(lambda x, y: self._columns[x].priority-self._columns[y].priority)
@@ -2453,6 +3473,11 @@ class orm(orm_template):
                     v[val] = vals[val]
             if v:
                 self.pool.get(table).write(cr, user, nids, v, context)
+        self._invalidate_cache(cr, ids, upd_todo + updend)
+        if self._name in _group_models:
+            invalidate_user_groups(cr)
+        elif self._name == 'ir.translation':
+            invalidate_translations(cr)
 
         self._validate(cr, user, ids, context)
 
@@ -2463,6 +3488,10 @@ class orm(orm_template):
         if parents_changed:
             if self.pool._init:
                 self.pool._init_parent[self._name]=True
+            elif self._parent_store == 'path':
+                for id in parents_changed:
+                    self._parent_path_move(cr, id, vals[self._parent_name])
+                self._invalidate_cache(cr, None, ['parent_path'])
             else:
                 order = self._parent_order or self._order
                 parent_val = vals[self._parent_name]
@@ -2474,6 +3503,10 @@ class orm(orm_template):
                 parents = cr.fetchall()
 
                 for id in parents_changed:
+                    if self._parent_store_gap:
+                        if self._parent_store_gap_move(cr, id, parent_val):
+                            continue
+                        queue_parent_rebalance(cr, self._name)
                     cr.execute('SELECT parent_left, parent_right FROM "%s" WHERE id=%%s' % (self._table,), (id,))
                     pleft, pright = cr.fetchone()
                     distance = pright - pleft + 1
@@ -2504,10 +3537,10 @@ class orm(orm_template):
                         cr.execute('update '+self._table+' set parent_left=parent_left+%s where parent_left>=%s', (distance, position))
                         cr.execute('update '+self._table+' set parent_right=parent_right+%s where parent_right>=%s', (distance, position))
                         cr.execute('update '+self._table+' set parent_left=parent_left-%s, parent_right=parent_right-%s where parent_left>=%s and parent_left<%s', (pleft-position+distance,pleft-position+distance, pleft+distance, pright+distance))
+                self._invalidate_cache(cr, None, ['parent_left', 'parent_right'])
 
         result += self._store_get_values(cr, user, ids, vals.keys(), context)
-        for order, object, ids, fields in result:
-            self.pool.get(object)._store_set_values(cr, user, ids, fields, context)
+        self._store_recompute(cr, user, result, context)
 
         # TODO: Check in OpenERP
         #wf_service = netsvc.LocalService("workflow")
@@ -2515,6 +3548,185 @@ class orm(orm_template):
         #    wf_service.trg_write(user, self._name, id, cr)
         return True
 
+    def write_multi(self, cr, user, values, context=None):
+        """ write_multi(cr, user, {id: vals}, context) -> True
+
+        Writes distinct values on each record: the records are grouped by
+        set of fields, and the classic columns of a group are written with
+        one UPDATE ... FROM (VALUES ...) per chunk. Access, rules,
+        constraints and stored functions are checked once for all the
+        records. Overrides of write are not called, except for the
+        translated fields and the parent of _parent_store, written with
+        write.
+        """
+        if not values:
+            return True
+        if not context:
+            context = {}
+        ids = values.keys()
+        self._check_concurrency(cr, ids, context)
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'write', context=context)
+
+        d1, d2 = self.pool.get('ir.rule').domain_get(cr, user, self._name)
+        select_query = 'SELECT id FROM "%s" WHERE id IN %%s' % (self._table,)
+        if d1:
+            select_query += ' AND ' + d1
+        for i in range(0, len(ids), cr.IN_MAX):
+            sub_ids = ids[i:i+cr.IN_MAX]
+            cr.execute(select_query, [tuple(sub_ids)] + d2)
+            if cr.rowcount != len(sub_ids):
+                raise AccessError('AccessError',
+                        'You try to bypass an access rule (Document type: %s).' % \
+                                self._description)
+
+        totranslate = context.get('lang', False) and (context['lang'] != 'en_US')
+        groups = {}
+        for id, vals in values.items():
+            vals = dict(vals)
+            for field in vals.keys():
+                fobj = field in self._columns and self._columns[field] or \
+                    (field in self._inherit_fields and self._inherit_fields[field][2])
+                if field in ('parent_left', 'parent_right', 'parent_path') or \
+                        (fobj and fobj.write and not user_in_groups(cr, user, fobj.write, self.pool)):
+                    del vals[field]
+                else:
+                    self._check_selection(cr, user, field, vals[field], context)
+            groups.setdefault(tuple(sorted(vals)), {})[id] = vals
+
+        written = set()
+        upd_todo = set()
+        updend = {}
+        delegated = {}
+        # ids whose write_uid and write_date are not set by _update_values
+        unlogged = []
+        for names, group in groups.items():
+            written.update(names)
+            classic = []
+            for field in names:
+                column = self._columns.get(field)
+                if column is None:
+                    updend.setdefault(self._inherit_fields[field][0], []).append(field)
+                elif (totranslate and column.translate) or \
+                        (self._parent_store and field == self._parent_name):
+                    delegated.setdefault(field, []).extend(group)
+                elif column._classic_write and not hasattr(column, '_fnct_inv'):
+                    classic.append(field)
+                else:
+                    upd_todo.add(field)
+            streams = [f for f in classic if isinstance(self._columns[f], fields.binary)
+                       and any(fields.is_stream(vals[f]) for vals in group.values())]
+            classic = [f for f in classic if f not in streams]
+            if classic:
+                self._update_values(cr, user, [[id] + [group[id][f] for f in classic] for id in group],
+                                    classic)
+            else:
+                unlogged.extend(group)
+            for f in streams:
+                for id in group:
+                    if fields.is_stream(group[id][f]):
+                        self._columns[f].set_stream(cr, self, [id], f, group[id][f])
+                    else:
+                        self._update_values(cr, user, [[id, group[id][f]]], [f])
+        if self._log_access:
+            # set by write() whatever the fields written
+            for i in range(0, len(unlogged), cr.IN_MAX):
+                cr.execute('UPDATE "%s" SET write_uid=%%s, write_date=now() WHERE id IN %%s' % (self._table,),
+                           (user, tuple(unlogged[i:i+cr.IN_MAX])))
+        self._invalidate_cache(cr, ids, list(written) + ['write_uid', 'write_date'])
+
+        # default element in context must be removed when call a one2many or many2many
+        rel_context = context.copy()
+        for c in context.items():
+            if c[0].startswith('default_'):
+                del rel_context[c[0]]
+
+        result = []
+        for field in sorted(upd_todo, key=lambda x: self._columns[x].priority):
+            for id, vals in values.items():
+                if field in vals:
+                    result += self._columns[field].set(cr, self, id, field, vals[field], user, context=rel_context) or []
+
+        for table, inherited in updend.items():
+            col = self._inherits[table]
+            parents = {}
+            for i in range(0, len(ids), cr.IN_MAX):
+                cr.execute('SELECT id, "%s" FROM "%s" WHERE id IN %%s' % (col, self._table),
+                           (tuple(ids[i:i+cr.IN_MAX]),))
+                parents.update(cr.fetchall())
+            parent_values = {}
+            for id, vals in values.items():
+                if parents.get(id):
+                    v = dict((f, vals[f]) for f in inherited if f in vals)
+                    if v:
+                        parent_values.setdefault(parents[id], {}).update(v)
+            self.pool.get(table).write_multi(cr, user, parent_values, context)
+
+        for field, field_ids in delegated.items():
+            for id in field_ids:
+                self.write(cr, user, [id], {field: values[id][field]}, context)
+
+        self._invalidate_cache(cr, ids, list(upd_todo) + sum(updend.values(), []))
+        if self._name in _group_models:
+            invalidate_user_groups(cr)
+        elif self._name == 'ir.translation':
+            invalidate_translations(cr)
+        self._validate(cr, user, ids, context)
+
+        result += self._store_get_values(cr, user, ids, list(written), context)
+        self._store_recompute(cr, user, result, context)
+        return True
+
+    def _sql_types(self, cr, names=()):
+        """ {column: SQL type} of the table, asked once, and again when one
+        of names is missing """
+        if self._column_types is None or \
+                [n for n in names if n not in self._column_types]:
+            cr.execute("SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute"
+                       " WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+                       ('"%s"' % (self._table,),))
+            self._column_types = dict(cr.fetchall())
+        return self._column_types
+
+    def _update_values(self, cr, user, rows, names, log_access=True):
+        """ write the rows [id, value of each name] with one UPDATE ... FROM
+        (VALUES ...) per chunk of rows, the values of the first row cast to
+        the types of the columns so that NULL ones keep their type """
+        types = self._sql_types(cr, names)
+        columns = [self._columns[n] for n in names]
+        upd0 = ['"%s"=_v."%s"' % (n, n) for n in names]
+        upd1 = []
+        if self._log_access and log_access:
+            upd0.append('write_uid=%s')
+            upd0.append('write_date=now()')
+            upd1.append(user)
+        first = '(%s::integer,' + ','.join(['(%s)::%s' % (c._symbol_set[0], types.get(n, 'text'))
+                                            for n, c in zip(names, columns)]) + ')'
+        other = '(%s,' + ','.join([c._symbol_set[0] for c in columns]) + ')'
+        head = 'UPDATE "%s" SET %s FROM (VALUES ' % (self._table, ','.join(upd0))
+        tail = ') AS _v(id, %s) WHERE "%s".id = _v.id' % (
+            ','.join(['"%s"' % n for n in names]), self._table)
+        for i in range(0, len(rows), cr.IN_MAX):
+            chunk = rows[i:i+cr.IN_MAX]
+            params = list(upd1)
+            for row in chunk:
+                params.append(row[0])
+                params.extend([c._symbol_set[1](v) for c, v in zip(columns, row[1:])])
+            cr.execute(head + ','.join([first] + [other] * (len(chunk) - 1)) + tail, params)
+
+    def _write_computed(self, cr, names, rows):
+        """ write the rows [id, value of each of names] computed for stored
+        function fields: with UPDATE ... FROM (VALUES ...), or through a
+        temporary table filled with COPY beyond IN_MAX rows """
+        if len(rows) <= cr.IN_MAX:
+            self._update_values(cr, None, rows, names, log_access=False)
+            return
+        types = self._sql_types(cr, names)
+        columns = [self._columns[n] for n in names]
+        bulk_update(cr, self._table, [(n, types[n]) for n in names],
+                    ([row[0]] + [c._symbol_set[1](v) for c, v in zip(columns, row[1:])]
+                     for row in rows),
+                    copy='bytea' not in [types[n] for n in names])
+
     #
     # TODO: Should set perm to user.xxx
     #
@@ -2602,64 +3814,34 @@ class orm(orm_template):
                 vals[bool_field] = False
         #End
         
+        streams = []
         for field in vals:
             if field in self._columns:
-                if self._columns[field]._classic_write:
+                if isinstance(self._columns[field], fields.binary) and fields.is_stream(vals[field]):
+                    streams.append(field)
+                elif self._columns[field]._classic_write:
                     upd0 = upd0 + ',"' + field + '"'
                     upd1 = upd1 + ',' + self._columns[field]._symbol_set[0]
                     upd2.append(self._columns[field]._symbol_set[1](vals[field]))
                 else:
                     if not isinstance(self._columns[field],fields.related):
                         upd_todo.append(field)
-            if field in self._columns \
-                    and hasattr(self._columns[field], 'selection') \
-                    and vals[field]:
-                if self._columns[field]._type == 'reference':
-                    val = vals[field].split(',')[0]
-                else:
-                    val = vals[field]
-                if isinstance(self._columns[field].selection, (tuple, list)):
-                    if val not in dict(self._columns[field].selection):
-                        raise ValidateException(('ValidateError'),
-                        ('The value "%s" for the field "%s" is not in the selection') \
-                                % (vals[field], field))
-                else:
-                    if val not in dict(self._columns[field].selection(
-                        self, cr, user, context=context)):
-                        raise ValidateException(('ValidateError'),
-                        ('The value "%s" for the field "%s" is not in the selection') \
-                                % (vals[field], field))
+            self._check_selection(cr, user, field, vals[field], context)
         if self._log_access:
             upd0 += ',create_uid,create_date'
             upd1 += ',%s,now()'
             upd2.append(user)
         cr.execute('insert into "'+self._table+'" (id'+upd0+") values ("+str(id_new)+upd1+')', tuple(upd2))
+        for field in streams:
+            self._columns[field].set_stream(cr, self, [id_new], field, vals[field])
         upd_todo.sort(lambda x, y: self._columns[x].priority-self._columns[y].priority)
 
         if self._parent_store and not context.get('defer_parent_store_computation'):
             if self.pool._init:
                 self.pool._init_parent[self._name]=True
             else:
-                parent = vals.get(self._parent_name, False)
-                if parent:
-                    cr.execute('select parent_right from '+self._table+' where '+self._parent_name+'=%s order by '+(self._parent_order or self._order), (parent,))
-                    pleft_old = None
-                    result_p = cr.fetchall()
-                    for (pleft,) in result_p:
-                        if not pleft:
-                            break
-                        pleft_old = pleft
-                    if not pleft_old:
-                        cr.execute('select parent_left from '+self._table+' where id=%s', (parent,))
-                        pleft_old = cr.fetchone()[0]
-                    pleft = pleft_old
-                else:
-                    cr.execute('select max(parent_right) from '+self._table)
-                    pleft = cr.fetchone()[0] or 0
-                cr.execute('update '+self._table+' set parent_left=parent_left+2 where parent_left>%s', (pleft,))
-                cr.execute('update '+self._table+' set parent_right=parent_right+2 where parent_right>%s', (pleft,))
-                cr.execute('update '+self._table+' set parent_left=%s,parent_right=%s where id=%s', (pleft+1,pleft+2,id_new))
-                
+                self._parent_store_insert(cr, id_new, vals.get(self._parent_name, False))
+
         # default element in context must be removed when call a one2many or many2many
         rel_context = context.copy()
         for c in context.items():
@@ -2669,22 +3851,329 @@ class orm(orm_template):
         result = []
         for field in upd_todo:
             result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
+        self._invalidate_cache(cr, [id_new], vals.keys(), event='create')
+        if self._name in _group_models:
+            invalidate_user_groups(cr)
+        elif self._name == 'ir.translation':
+            invalidate_translations(cr)
         self._validate(cr, user, [id_new], context)
 
         if not context.get('no_store_function', False):
             result += self._store_get_values(cr, user, [id_new], vals.keys(), context)
-            result.sort()
-            done = []
-            for order, object, ids, fields2 in result:
-                if not (object, ids, fields2) in done:
-                    self.pool.get(object)._store_set_values(cr, user, ids, fields2, context)
-                    done.append((object, ids, fields2))
+            self._store_recompute(cr, user, result, context)
 
         # TODO: Check in OpenERP
         #wf_service = netsvc.LocalService("workflow")
         #wf_service.trg_create(user, self._name, id_new, cr)
         return id_new
 
+    def create_multi(self, cr, user, vals_list, context=None):
+        """ create_multi(cr, user, [vals, ...], context) -> [ids]
+
+        Creates the records in bulk: their ids are reserved in one query and
+        their columns inserted with multi-row INSERTs. The parents of
+        _inherits are created with create_multi, and the constraints and the
+        stored functions are handled once for all the records. Overrides of
+        create are not called.
+        """
+        if not vals_list:
+            return []
+        if not context:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'create', context=context)
+
+        records = []
+        defaults = {}
+        for vals in vals_list:
+            vals = vals.copy()
+            avoid_table = [t for t, c in self._inherits.items() if c in vals]
+            default = tuple([f for f in self._columns.keys()
+                             if f not in vals and not isinstance(self._columns[f], fields.property)] +
+                            [f for f in self._inherit_fields.keys()
+                             if f not in vals and self._inherit_fields[f][0] not in avoid_table
+                             and not isinstance(self._inherit_fields[f][2], fields.property)])
+            if default:
+                # the defaults are asked once per set of missing fields
+                if default not in defaults:
+                    default_values = self.default_get(cr, user, list(default), context)
+                    for dv in default_values:
+                        if dv in self._columns and self._columns[dv]._type == 'many2many':
+                            if default_values[dv] and isinstance(default_values[dv][0], (int, long)):
+                                default_values[dv] = [(6, 0, default_values[dv])]
+                    defaults[default] = default_values
+                vals.update(defaults[default])
+            records.append(vals)
+
+        # parents of _inherits, the new ones created in bulk
+        parents = [{} for vals in records]
+        for table, col in self._inherits.items():
+            tocreate = []
+            for vals, rec_parents in zip(records, parents):
+                values = dict((f, vals.pop(f)) for f in vals.keys()
+                              if f in self._inherit_fields and self._inherit_fields[f][0] == table)
+                record_id = vals.pop(col, False)
+                if record_id:
+                    self.pool.get(table).write(cr, user, [record_id], values, context=context)
+                    rec_parents[col] = record_id
+                else:
+                    tocreate.append((rec_parents, values))
+            if tocreate:
+                new_ids = self.pool.get(table).create_multi(cr, user, [v for p, v in tocreate], context=context)
+                for (rec_parents, values), record_id in zip(tocreate, new_ids):
+                    rec_parents[col] = record_id
+
+        try:
+            cr.execute("SELECT nextval('%s') FROM generate_series(1, %%s)" % (self._sequence,),
+                       (len(records),))
+        except:
+            raise except_orm(_('UserError'),
+                        _('You cannot perform this operation.'))
+        ids = [row[0] for row in cr.fetchall()]
+
+        bool_fields = [x for x in self._columns.keys() if self._columns[x]._type=='boolean']
+        groups = {}
+        upd_todo = set()
+        streams = []
+        written = set()
+        for id_new, vals, rec_parents in zip(ids, records, parents):
+            for f in vals.keys():
+                if f not in self._columns:
+                    del vals[f]
+            for bool_field in bool_fields:
+                if bool_field not in vals:
+                    vals[bool_field] = False
+            names = rec_parents.keys()
+            row = [id_new] + [rec_parents[n] for n in names]
+            for field in vals:
+                column = self._columns[field]
+                if isinstance(column, fields.binary) and fields.is_stream(vals[field]):
+                    streams.append((id_new, field, vals[field]))
+                elif column._classic_write:
+                    names.append(field)
+                    row.append(column._symbol_set[1](vals[field]))
+                elif not isinstance(column, fields.related):
+                    upd_todo.add(field)
+                self._check_selection(cr, user, field, vals[field], context)
+            written.update(vals)
+            if self._log_access:
+                row.append(user)
+            groups.setdefault(tuple(names), []).append(row)
+
+        # one INSERT per set of columns and chunk of rows
+        for names, rows in groups.items():
+            upd0 = ''.join([',"%s"' % n for n in names])
+            upd1 = ''.join([',' + (n in self._columns and self._columns[n]._symbol_set[0] or '%s')
+                            for n in names])
+            if self._log_access:
+                upd0 += ',create_uid,create_date'
+                upd1 += ',%s,now()'
+            for i in range(0, len(rows), cr.IN_MAX):
+                chunk = rows[i:i+cr.IN_MAX]
+                cr.execute('insert into "' + self._table + '" (id' + upd0 + ') values ' +
+                           ','.join(['(%s' + upd1 + ')'] * len(chunk)),
+                           tuple(itertools.chain(*chunk)))
+        for id_new, field, stream in streams:
+            self._columns[field].set_stream(cr, self, [id_new], field, stream)
+
+        if self._parent_store and not context.get('defer_parent_store_computation'):
+            if self.pool._init:
+                self.pool._init_parent[self._name]=True
+            elif len(ids) <= config.get('parent_store_insert_max', 100):
+                # the parents exist already, the new ids being reserved above
+                for id_new, vals in zip(ids, records):
+                    self._parent_store_insert(cr, id_new, vals.get(self._parent_name, False))
+            else:
+                self._parent_store_compute(cr)
+                self._invalidate_cache(cr, None, self._parent_store_columns())
+
+        # default element in context must be removed when call a one2many or many2many
+        rel_context = context.copy()
+        for c in context.items():
+            if c[0].startswith('default_'):
+                del rel_context[c[0]]
+
+        result = []
+        for field in sorted(upd_todo, key=lambda x: self._columns[x].priority):
+            for id_new, vals in zip(ids, records):
+                if field in vals:
+                    result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
+        self._invalidate_cache(cr, ids, list(written), event='create')
+        if self._name in _group_models:
+            invalidate_user_groups(cr)
+        elif self._name == 'ir.translation':
+            invalidate_translations(cr)
+        self._validate(cr, user, ids, context)
+
+        if not context.get('no_store_function', False):
+            result += self._store_get_values(cr, user, ids, list(written), context)
+            self._store_recompute(cr, user, result, context)
+        return ids
+
+    def _check_selection(self, cr, user, field, value, context):
+        """ raise ValidateException if value is not in the selection of the
+        field, if it has one """
+        column = self._columns.get(field)
+        if not (column and hasattr(column, 'selection') and value):
+            return
+        if column._type == 'reference':
+            val = value.split(',')[0]
+        else:
+            val = value
+        if val not in selection_keys(cr, user, self, field, context):
+            raise ValidateException(('ValidateError'),
+                ('The value "%s" for the field "%s" is not in the selection') \
+                        % (value, field))
+
+    def _parent_store_columns(self):
+        """ columns maintained for _parent_store """
+        if self._parent_store == 'path':
+            return ['parent_path']
+        return ['parent_left', 'parent_right']
+
+    def _parent_path_move(self, cr, id, parent):
+        """ set the path of id below parent, and the paths of its subtree """
+        cr.execute('select parent_path from '+self._table+' where id=%s', (id,))
+        old = cr.fetchone()[0]
+        path = []
+        if parent:
+            cr.execute('select parent_path from '+self._table+' where id=%s', (parent,))
+            path = cr.fetchone()[0]
+            if path and id in path:
+                raise except_orm(_('UserError'), _('Recursivity Detected.'))
+        if not old or path is None:
+            # the path of the node or of its parent is not known, nor are
+            # the ones of the subtree: computed again
+            self._parent_store_compute(cr)
+            return
+        cr.execute('update '+self._table+' set parent_path=%s::integer[] || parent_path[%s:array_length(parent_path, 1)] where parent_path @> ARRAY[%s]', (path, len(old), id))
+
+    def _parent_store_insert(self, cr, id_new, parent):
+        """ place the new record id_new as last child of parent in the
+        nested set, or below parent in the materialized paths """
+        if self._parent_store == 'path':
+            if not parent:
+                cr.execute('update '+self._table+' set parent_path=%s where id=%s', ([id_new], id_new))
+            else:
+                cr.execute('update '+self._table+' set parent_path=p.parent_path || %s from '+self._table+' p where p.id=%s and p.parent_path is not null and '+self._table+'.id=%s', (id_new, parent, id_new))
+                if not cr.rowcount:
+                    # the path of the parent is not known: computed again
+                    self._parent_store_compute(cr)
+                    self._invalidate_cache(cr, None, ['parent_path'])
+                    return
+            self._invalidate_cache(cr, [id_new], ['parent_path'])
+            return
+        if self._parent_store_gap:
+            if self._parent_store_gap_insert(cr, id_new, parent):
+                self._invalidate_cache(cr, [id_new], ['parent_left', 'parent_right'])
+                return
+            queue_parent_rebalance(cr, self._name)
+        if parent:
+            cr.execute('select parent_right from '+self._table+' where '+self._parent_name+'=%s order by '+(self._parent_order or self._order), (parent,))
+            pleft_old = None
+            result_p = cr.fetchall()
+            for (pleft,) in result_p:
+                if not pleft:
+                    break
+                pleft_old = pleft
+            if not pleft_old:
+                cr.execute('select parent_left from '+self._table+' where id=%s', (parent,))
+                pleft_old = cr.fetchone()[0]
+            pleft = pleft_old
+        else:
+            cr.execute('select max(parent_right) from '+self._table)
+            pleft = cr.fetchone()[0] or 0
+        cr.execute('update '+self._table+' set parent_left=parent_left+2 where parent_left>%s', (pleft,))
+        cr.execute('update '+self._table+' set parent_right=parent_right+2 where parent_right>%s', (pleft,))
+        cr.execute('update '+self._table+' set parent_left=%s,parent_right=%s where id=%s', (pleft+1,pleft+2,id_new))
+        self._invalidate_cache(cr, None, ['parent_left', 'parent_right'])
+
+    def _parent_store_room(self, cr, parent, id):
+        """ (end of the last child of parent other than id, end of the room
+        left in parent, None when unbounded)
+
+        The parent row, or the roots of the table, stay locked until the end
+        of the transaction: the records placed concurrently in the same room
+        wait for it and see its last child. """
+        if not parent:
+            cr.execute('select pg_advisory_xact_lock(%s::regclass::oid::integer, 0)', ('"%s"' % (self._table,),))
+            cr.execute('select max(parent_right) from '+self._table+' where id!=%s', (id,))
+            return cr.fetchone()[0] or 0, None
+        cr.execute('select parent_left, parent_right from '+self._table+' where id=%s for update', (parent,))
+        pleft, pright = cr.fetchone()
+        if pleft is None or pright is None:
+            return None, None
+        cr.execute('select max(parent_right) from '+self._table+' where '+self._parent_name+'=%s and id!=%s', (parent, id))
+        return cr.fetchone()[0] or pleft, pright
+
+    def _parent_store_gap_insert(self, cr, id_new, parent):
+        """ place id_new after the last child of parent, in the room left in
+        the interval of parent; False when there is not enough
+
+        The new interval takes at most half of the room, to leave some to
+        the next siblings. """
+        end, limit = self._parent_store_room(cr, parent, id_new)
+        if end is None:
+            return False
+        size = self._parent_store_gap + 2
+        if limit is not None:
+            room = limit - end - 1
+            if room < 2:
+                return False
+            size = max(2, min(size, room // 2))
+        cr.execute('update '+self._table+' set parent_left=%s,parent_right=%s where id=%s', (end+1, end+size, id_new))
+        return True
+
+    def _parent_store_gap_move(self, cr, id, parent):
+        """ move the subtree of id after the last child of parent, in the
+        room left in the interval of parent, updating the subtree only;
+        False when there is not enough """
+        cr.execute('select parent_left, parent_right from '+self._table+' where id=%s', (id,))
+        left, right = cr.fetchone()
+        end, limit = self._parent_store_room(cr, parent, id)
+        if end is None or left is None:
+            return False
+        if parent and left <= end <= right:
+            raise except_orm(_('UserError'), _('Recursivity Detected.'))
+        if limit is not None and limit - end - 1 < right - left + 1:
+            return False
+        offset = end + 1 - left
+        cr.execute('update '+self._table+' set parent_left=parent_left+%s, parent_right=parent_right+%s where parent_left>=%s and parent_left<=%s', (offset, offset, left, right))
+        return True
+
+    def _store_recompute(self, cr, uid, result, context):
+        """ run the (priority, model, ids, fields) triggers of
+        _store_get_values in the order of their priority, or queue them
+        when the cursor defers them, see enable_deferred_recompute() """
+        if queue_recompute(cr, self.pool, uid, result, context):
+            return
+        result.sort()
+        done = []
+        for order, object, ids, fields2 in result:
+            if not (object, ids, fields2) in done:
+                self.pool.get(object)._store_set_values(cr, uid, ids, fields2, context)
+                done.append((object, ids, fields2))
+
+    def _flush_recompute(self, cr, names=None):
+        """ flush the queued recomputations when one of the fields names
+        (all if None) of the model, or of its _inherits ancestors, is
+        pending """
+        pending = recompute_pending(cr)
+        if not pending:
+            return
+        if names is None:
+            models = [self._name]
+            for name in models:
+                models += [m for m in self.pool.get(name)._inherits if m not in models]
+            if [m for m in models if m in pending]:
+                flush_recompute(cr)
+            return
+        for name in names:
+            # the model declaring the field, through the _inherits chain
+            owner = (self._inherits_path(name) or [self._name])[-1]
+            if name in pending.get(owner, ()):
+                flush_recompute(cr)
+                return
+
     def _store_get_values(self, cr, uid, ids, fields, context):
         result = {}
         fncts = self.pool._store_function.get(self._name, [])
@@ -2729,38 +4218,42 @@ class orm(orm_template):
                 keys.append(self._columns[f]._multi)
             todo.setdefault(self._columns[f]._multi, [])
             todo[self._columns[f]._multi].append(f)
+        getters = []
         for key in keys:
             val = todo[key]
             if key:
-                result = self._columns[val[0]].get(cr, self, ids, val, uid, context=context)
-                for id,value in result.items():
-                    upd0 = []
-                    upd1 = []
-                    for v in value:
-                        if v not in val:
-                            continue
-                        if self._columns[v]._type in ('many2one', 'one2one'):
-                            try:
-                                value[v] = value[v][0]
-                            except:
-                                pass
-                        upd0.append('"'+v+'"='+self._columns[v]._symbol_set[0])
-                        upd1.append(self._columns[v]._symbol_set[1](value[v]))
-                    upd1.append(id)
-                    cr.execute('update "' + self._table + '" set ' + \
-                        string.join(upd0, ',') + ' where id = %s', upd1)
+                getters.append((val, self._getter(val[0], ids, val, uid, context)))
+            else:
+                for f in val:
+                    getters.append(([f], self._getter(f, ids, f, uid, context)))
+        results = iter(self._compute_getters(cr, getters))
 
+        def stored(f, value):
+            if self._columns[f]._type in ('many2one', 'one2one'):
+                try:
+                    return value[0]
+                except:
+                    pass
+            return value
+
+        for key in keys:
+            val = todo[key]
+            if key:
+                result = results.next()
+                # written in bulk by set of fields returned
+                rows = {}
+                for id,value in result.items():
+                    names = tuple([v for v in val if v in value])
+                    rows.setdefault(names, []).append([id] + [stored(v, value[v]) for v in names])
+                for names, values in rows.items():
+                    if names:
+                        self._write_computed(cr, list(names), values)
             else:
                 for f in val:
-                    result = self._columns[f].get(cr, self, ids, f, uid, context=context)
-                    for id,value in result.items():
-                        if self._columns[f]._type in ('many2one', 'one2one'):
-                            try:
-                                value = value[0]
-                            except:
-                                pass
-                        cr.execute('update "' + self._table + '" set ' + \
-                            '"'+f+'"='+self._columns[f]._symbol_set[0] + ' where id = %s', (self._columns[f]._symbol_set[1](value),id))
+                    result = results.next()
+                    self._write_computed(cr, [f], [[id, stored(f, value)]
+                                                   for id, value in result.items()])
+        self._invalidate_cache(cr, ids, fields)
         return True
 
     #
@@ -2805,11 +4298,19 @@ class orm(orm_template):
             raise AccessError(('AccessError'), ('Bad query.'))
         return True
 
-    def search(self, cr, user, args, offset=0, limit=None, order=None,
-            context=None, count=False):
+    def _search_query(self, cr, user, args, order=None, context=None):
+        """ (from and where clause, params, order by) of the records matching
+        args, ir.rule included """
         if not context:
             context = {}
-        self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
+        if recompute_pending(cr):
+            # the pending fields searched or sorted on are recomputed first
+            names = [leaf[0] for leaf in args if isinstance(leaf, (list, tuple))]
+            if [n for n in names if '.' in n]:
+                flush_recompute(cr)
+            else:
+                names += [o.strip().split(' ')[0].strip('"') for o in (order or self._order).split(',')]
+                self._flush_recompute(cr, names)
         # compute the where, order by, limit and offset clauses
         (qu1, qu2, tables) = self._where_calc(cr, user, args, context=context)
 
@@ -2822,23 +4323,30 @@ class orm(orm_template):
             self._check_qorder(order)
         order_by = order or self._order
 
-        limit_str = limit and ' limit %d' % limit or ''
-        offset_str = offset and ' offset %d' % offset or ''
-
-
         # construct a clause for the rules :
         d1, d2 = self.pool.get('ir.rule').domain_get(cr, user, self._name)
         if d1:
             qu1 = qu1 and qu1+' and '+d1 or ' where '+d1
             qu2 += d2
+        return ' from ' + ','.join(tables) + qu1, qu2, order_by
+
+    def search(self, cr, user, args, offset=0, limit=None, order=None,
+            context=None, count=False):
+        if not context:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
+        from_where, params, order_by = self._search_query(cr, user, args, order, context)
+
+        limit_str = limit and ' limit %d' % limit or ''
+        offset_str = offset and ' offset %d' % offset or ''
 
         if count:
-            cr.execute('select count(%s.id) from ' % self._table +
-                    ','.join(tables) +qu1 + limit_str + offset_str, qu2)
+            cr.execute('select count(%s.id)' % self._table +
+                    from_where + limit_str + offset_str, params)
             res = cr.fetchall()
             return res[0][0]
         # execute the "main" query to fetch the ids we were searching for
-        cr.execute('select %s.id from ' % self._table + ','.join(tables) +qu1+' order by '+order_by+limit_str+offset_str, qu2)
+        cr.execute('select %s.id' % self._table + from_where+' order by '+order_by+limit_str+offset_str, params)
         res = cr.fetchall()
         return [x[0] for x in res]
 
@@ -2847,37 +4355,66 @@ class orm(orm_template):
         if not context:
             context = {}
         self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
-        # compute the where, order by, limit and offset clauses
-        (qu1, qu2, tables) = self._where_calc(cr, user, args, context=context)
-
-        if len(qu1):
-            qu1 = ' where '+string.join(qu1, ' and ')
-        else:
-            qu1 = ''
-
-        if order:
-            self._check_qorder(order)
-        order_by = order or self._order
+        from_where, params, order_by = self._search_query(cr, user, args, order, context)
 
         limit_str = limit and ' limit %d' % limit or ''
         offset_str = offset and ' offset %d' % offset or ''
 
-
-        # construct a clause for the rules :
-        d1, d2 = self.pool.get('ir.rule').domain_get(cr, user, self._name)
-        if d1:
-            qu1 = qu1 and qu1+' and '+d1 or ' where '+d1
-            qu2 += d2
-        
         if not fields:
             fields = self.fields_get(cr, user, fields, context).keys()
         fields += ['id']
         
         # execute the "main" query to fetch the ids we were searching for
-        cr.execute('select %s from ' % ','.join(map(lambda x: '%s.%s' % (self._table , x), fields)) + ','.join(tables) +qu1+' order by '+order_by+limit_str+offset_str, qu2)
+        cr.execute('select %s' % ','.join(map(lambda x: '%s.%s' % (self._table , x), fields)) + from_where+' order by '+order_by+limit_str+offset_str, params)
         res = cr.dictfetchall()
         return res
 
+    def read_iter(self, cr, user, ids=None, fields=None, batch_size=1000, context=None,
+                  load='_classic_read', order=None, domain=None):
+        """ iterator of the rows read(), batch_size records at a time
+
+        Reads the list ids, or else the records matching domain ([] for all
+        of them), whose ids are fetched through a server side cursor, so
+        that neither the ids nor the rows are ever all in memory. This
+        cursor is held across the commits made between the batches.
+
+        The access is checked at the call, before the first row.
+        """
+        if not context:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
+        if ids is not None:
+            return self._read_iter_ids(cr, user, ids, fields, batch_size, context, load)
+        query = self._search_query(cr, user, domain or [], order, context)
+        return self._read_iter_query(cr, user, query, fields, batch_size, context, load)
+
+    def _read_iter_ids(self, cr, user, ids, fields, batch_size, context, load):
+        for i in range(0, len(ids), batch_size):
+            for row in self.read(cr, user, ids[i:i+batch_size], fields, context, load):
+                yield row
+
+    def _read_iter_query(self, cr, user, query, fields, batch_size, context, load):
+        from_where, params, order_by = query
+        name = 'read_iter_%d' % _cursor_names.next()
+        cr.execute('DECLARE %s NO SCROLL CURSOR WITH HOLD FOR SELECT %s.id' % (name, self._table) +
+                   from_where + ' ORDER BY ' + order_by, params)
+        try:
+            while True:
+                cr.execute('FETCH %d FROM %s' % (batch_size, name))
+                batch = [x[0] for x in cr.fetchall()]
+                if not batch:
+                    break
+                for row in self.read(cr, user, batch, fields, context, load):
+                    yield row
+        except Exception:
+            # CLOSE would fail in an aborted transaction and hide the
+            # error: the cursor is dropped when it is rolled back
+            name = None
+            raise
+        finally:
+            if name:
+                cr.execute('CLOSE %s' % (name,))
+
     # returns the different values ever entered for one field
     # this is used, for example, in the client when the user hits enter on
     # a char field
@@ -2969,7 +4506,7 @@ class orm(orm_template):
 
         # make sure we don't break the current parent_store structure and
         # force a clean recompute!
-        for parent_column in ['parent_left', 'parent_right']:
+        for parent_column in ['parent_left', 'parent_right', 'parent_path']:
             data.pop(parent_column, None)
 
         for v in self._inherits:
@@ -0,0 +1,183 @@
+from ooda import fields
+from ooda.cache import enable_transaction_cache
+from ooda.orm import orm_template, browse_record_list
+
+from spec import fakes
+from spec.fakes import cursor
+
+
+class model(orm_template):
+    def __init__(self, pool, name, columns, rows):
+        self.pool = pool
+        self._name = name
+        self._columns = columns
+        self._inherit_fields = {}
+        self._prefetch_map = None
+        self.rows = rows
+        self.reads = []
+        self.fields_read = []
+        pool[name] = self
+
+    def read(self, cr, uid, ids, fields=None, context=None, load='_classic_read'):
+        self.reads.append(sorted(ids))
+        self.fields_read.append(sorted(fields))
+        return [dict(self.rows[id], id=id) for id in ids]
+
+    def search(self, cr, uid, domain, offset=0, limit=None, order=None, context=None, count=False):
+        ids = domain[0][2]
+        return sorted(id for id in ids if self.rows[id]['name'] in domain[1][2])
+
+    def touch(self, cr, uid, ids, value):
+        return (ids, value)
+
+
+with description('A browse record list'):
+    with before.each:
+        self.pool = {}
+        self.partners = model(self.pool, 'res.partner', {
+            'name': fields.char('Name', size=64),
+        }, {10: {'name': 'b'}, 11: {'name': 'a'}})
+        self.lines = model(self.pool, 'sale.line', {
+            'name': fields.char('Name', size=64),
+            'partner_id': fields.many2one('res.partner', 'Partner'),
+        }, dict((id, {'name': 'l%d' % id, 'partner_id': 10 + id % 2})
+                for id in range(1, 6)))
+        self.records = self.lines.browse(cursor(), 1, [1, 2, 3, 4, 5])
+
+    with it('must map a dotted path with one read per hop'):
+        assert sorted(self.records.mapped('partner_id.name')) == ['a', 'b']
+        assert self.lines.reads == [[1, 2, 3, 4, 5]]
+        assert self.partners.reads == [[10, 11]]
+        assert self.records.mapped('partner_id').ids == [11, 10]
+
+    with it('must filter and sort the records'):
+        records = self.records.filtered(lambda r: r.id % 2)
+        assert isinstance(records, browse_record_list)
+        assert records.ids == [1, 3, 5]
+        assert self.records.filtered([('name', 'in', ['l2', 'l4'])]).ids == [2, 4]
+        assert self.records.sorted('partner_id.name').ids == [1, 3, 5, 2, 4]
+
+    with it('must dispatch the methods of the model with all the ids'):
+        assert self.records.touch(42) == ([1, 2, 3, 4, 5], 42)
+
+
+with description('The prefetch of one2many and many2many fields'):
+    with it('must read the flagged fields together for the whole browse set'):
+        pool = {}
+        model(pool, 'res.tag', {'name': fields.char('Name', size=64)}, {})
+        model(pool, 'sale.line', {'name': fields.char('Name', size=64)}, {})
+        partners = model(pool, 'res.partner', {
+            'name': fields.char('Name', size=64),
+            'line_ids': fields.one2many('sale.line', 'partner_id', 'Lines', prefetch=True),
+            'tag_ids': fields.many2many('res.tag', 'partner_tag_rel', 'partner_id', 'tag_id',
+                                        'Tags', prefetch=True),
+            'note_ids': fields.one2many('sale.line', 'partner_id', 'Notes'),
+        }, dict((id, {'name': 'p', 'line_ids': [id], 'tag_ids': [], 'note_ids': []})
+                for id in (10, 11, 12)))
+        records = partners.browse(cursor(), 1, [10, 11, 12])
+        assert records[0].line_ids[0].id == 10
+        assert partners.reads == [[10, 11, 12]]
+        assert partners.fields_read == [['line_ids', 'tag_ids']]
+        assert [len(r.tag_ids) for r in records] == [0, 0, 0]
+        assert records[2].line_ids[0].id == 12
+        assert len(partners.reads) == 1
+        records[1].note_ids
+        assert partners.fields_read[1:] == [['note_ids']]
+
+
+class grouped(fakes.model):
+    _prefetch_groups = {'header': ['name', 'ref']}
+
+    def __init__(self):
+        super(grouped, self).__init__({
+            'name': fields.char('Name', size=64),
+            'ref': fields.char('Reference', size=16),
+            'qty': fields.integer('Quantity'),
+            'note': fields.text('Note'),
+        })
+
+
+with description('The prefetch groups'):
+    with before.each:
+        self.model = grouped()
+        self.cr = fakes.table_cursor(dict((id, {'name': 'n%d' % id, 'ref': 'r', 'qty': id, 'note': ''})
+                                          for id in range(1, 6)))
+        enable_transaction_cache(self.cr)
+
+    with it('must fetch a group in one query per batch of pending records'):
+        records = self.model.browse(self.cr, 1, [1, 2, 3])
+        assert records[0].name == 'n1'
+        assert records[2].ref == 'r'
+        assert self.cr.selects() == [(['id', 'name', 'ref'], [1, 2, 3])]
+        assert records[1].qty == 2
+        assert self.cr.selects()[1:] == [(['id', 'note', 'qty'], [1, 2, 3])]
+        assert records[2].note == ''
+        assert len(self.cr.selects()) == 2
+
+    with it('must fetch the groups already used along for the new records'):
+        records = self.model.browse(self.cr, 1, [1, 2])
+        records[0].name
+        records[0].qty
+        more = self.model.browse(self.cr, 1, [3, 4, 5])
+        assert more[0].qty == 3
+        assert self.cr.selects()[2:] == [(['id', 'name', 'note', 'qty', 'ref'], [3, 4, 5])]
+        assert [r.name for r in more] == ['n3', 'n4', 'n5']
+        assert [r.note for r in records + more] == [''] * 5
+        assert len(self.cr.selects()) == 3
+
+    with it('must fetch the fields which are not prefetched alone'):
+        self.model._columns['image'] = fields.binary('Image')
+        for row in self.cr.table.values():
+            row['image'] = 'data'
+        records = self.model.browse(self.cr, 1, [1, 2])
+        assert records[0].image == 'data'
+        assert records[0].qty == 1
+        assert self.cr.selects() == [(['id', 'image'], [1, 2]), (['id', 'note', 'qty'], [1, 2])]
+
+
+class langs(object):
+    def __init__(self, codes):
+        self.codes = codes
+        self.searches = 0
+
+    def search(self, cr, uid, domain):
+        self.searches += 1
+        return [self.codes.index(domain[0][2]) + 1] if domain[0][2] in self.codes else []
+
+    def browse(self, cr, uid, id):
+        return self.codes[id - 1]
+
+
+class amount(object):
+    def __init__(self, value):
+        self.value = value
+
+    def set_value(self, cr, uid, value, record, field, lang):
+        self.lang = lang
+
+
+with description('A browse with fields_process'):
+    with before.each:
+        self.pool = {'res.lang': langs(['en_US', 'fr_FR'])}
+        self.lines = model(self.pool, 'sale.line', {
+            'price': fields.float('Price'),
+            'total': fields.function(lambda *a: {}, type='float', string='Total'),
+        }, {1: {'price': 2.0, 'total': 4.0}, 2: {'price': 0.0, 'total': False}})
+
+    with it('must process the values with the language looked up once'):
+        records = self.lines.browse(cursor(), 1, [1, 2], context={'lang': 'fr_FR'},
+                                    fields_process={'float': amount})
+        assert records[0].price.value == 2.0 and records[0].price.lang == 'fr_FR'
+        assert records[1].price.value == 0.0
+        assert records[0].total.value == 4.0 and records[1].total.value is False
+        assert self.pool['res.lang'].searches == 1
+
+    with it('must report a language which is not defined'):
+        records = self.lines.browse(cursor(), 1, [1], context={'lang': 'de_DE'},
+                                    fields_process={'float': amount})
+        try:
+            records[0].price
+        except Exception, e:
+            assert 'de_DE' in str(e)
+        else:
+            assert False
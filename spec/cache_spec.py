@@ -0,0 +1,228 @@
+from ooda.cache import model_cache, browse_cache, prefetch_counters, lru_cache, \
+    enable_transaction_cache, transaction_cache, transaction_caches
+
+from ooda import fields
+from ooda.orm import model_translations, invalidate_translations, _translations
+
+from spec import fakes
+from spec.fakes import cursor
+
+
+with description('A model cache'):
+    with before.each:
+        self.cache = model_cache()
+        for id in (1, 2, 3):
+            self.cache.add(id)
+
+    with it('must store values by record and field'):
+        self.cache.set(2, 'name', 'foo')
+        assert self.cache.has(2, 'name')
+        assert not self.cache.has(1, 'name')
+        assert self.cache.get(2, 'name') == 'foo'
+        assert self.cache.get(1, 'name', False) is False
+
+    with it('must raise KeyError for a field not loaded'):
+        try:
+            self.cache.value(3, 'name')
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('KeyError expected')
+
+    with it('must return the pending ids of a group only once'):
+        assert self.cache.pending('_classic') == [1, 2, 3]
+        assert self.cache.pending('_classic') == []
+        self.cache.add(4)
+        assert self.cache.pending('_classic') == [4]
+        assert self.cache.pending('other') == [1, 2, 3, 4]
+
+    with it('must return again the ids flagged as unfetched'):
+        ids = self.cache.pending('_classic')
+        self.cache.unfetched('_classic', ids[:2])
+        assert sorted(self.cache.pending('_classic')) == [1, 2]
+
+    with it('must fetch again the invalidated values'):
+        self.cache.pending('_classic')
+        for id in (1, 2, 3):
+            self.cache.set(id, 'name', 'foo')
+        self.cache.invalidate([2], ['name'], ['_classic'])
+        assert self.cache.has(1, 'name')
+        assert not self.cache.has(2, 'name')
+        assert self.cache.pending('_classic') == [2]
+        self.cache.invalidate()
+        assert not self.cache.has(1, 'name')
+        assert self.cache.pending('_classic') == [1, 2, 3]
+
+    with it('must not fetch again the forgotten records'):
+        self.cache.pending('_classic')
+        self.cache.set(2, 'name', 'foo')
+        self.cache.unfetched('_classic', [2, 3])
+        self.cache.forget([2])
+        assert 2 not in self.cache and not self.cache.has(2, 'name')
+        self.cache.add(4)
+        assert sorted(self.cache.pending('_classic')) == [3, 4]
+        self.cache.invalidate()
+        assert self.cache.pending('_classic') == [1, 3, 4]
+        assert self.cache.keys() == [1, 3, 4] and len(self.cache) == 3
+
+
+with description('A browse cache'):
+    with it('must hold one model cache per model'):
+        cache = browse_cache()
+        data = cache.model('res.partner')
+        assert cache.model('res.partner') is data
+        assert cache['res.partner'] is data
+
+
+with description('The transaction cache'):
+    with it('must be shared until the transaction ends'):
+        cr = cursor()
+        assert transaction_cache(cr, 1, {}) is None
+        assert enable_transaction_cache(cr)
+        cache = transaction_cache(cr, 1, {'lang': 'fr_FR'})
+        assert transaction_cache(cr, 1, {'lang': 'fr_FR'}) is cache
+        assert transaction_cache(cr, 1, {}) is not cache
+        assert len(transaction_caches(cr)) == 2
+        cr.rollback()
+        assert transaction_caches(cr) == []
+        assert transaction_cache(cr, 1, {'lang': 'fr_FR'}) is not cache
+
+
+with description('The translations of the models'):
+    with it('must be loaded again once the change is committed'):
+        obj = fakes.model({'name': fields.char('Name', size=64)})
+        cr = cursor()
+        key = ('test', 'test.model', False)
+        model_translations(cr, obj, False)
+        invalidate_translations(cr)
+        assert _translations.get(key) is None
+        # loaded by another transaction before the commit
+        model_translations(cursor(), obj, False)
+        cr.commit()
+        assert _translations.get(key) is None
+
+
+with description('The invalidation of the transaction cache'):
+    with before.each:
+        self.pool = fakes.registry()
+        self.partners = fakes.model({
+            'name': fields.char('Name', size=64),
+            'parent_id': fields.many2one('res.partner', 'Parent'),
+            'child_ids': fields.one2many('res.partner', 'parent_id', 'Children'),
+        }, 'res.partner', self.pool)
+        self.addresses = fakes.model({
+            'street': fields.char('Street', size=64),
+            'partner_id': fields.many2one('res.partner', 'Partner', ondelete='cascade'),
+        }, 'res.address', self.pool)
+        self.cr = cursor()
+        enable_transaction_cache(self.cr)
+        cache = transaction_cache(self.cr, 1, {})
+        self.data = cache.model('res.partner')
+        for id in (1, 2, 3):
+            self.data.update(id, {'name': 'p%d' % id, 'parent_id': False, 'child_ids': []})
+        self.data.pending('_classic')
+        self.data.pending('child_ids')
+        self.address = cache.model('res.address')
+        for id, partner in ((10, 2), (11, 3)):
+            self.address.update(id, {'street': 's', 'partner_id': partner})
+        self.address.pending('_classic')
+
+    with it('must forget the unlinked records and the ones deleted in cascade'):
+        self.data.set(3, 'parent_id', 2)
+        self.partners._invalidate_cache(self.cr, [2], event='unlink')
+        assert 2 not in self.data
+        assert not self.data.has(3, 'parent_id') and self.data.has(1, 'parent_id')
+        self.data.add(4)
+        assert sorted(self.data.pending('_classic')) == [3, 4]
+        assert 10 not in self.address and self.address.get(11, 'street') == 's'
+        assert self.address.pending('_classic') == []
+
+    with it('must forget the children of an _inherits deleted along'):
+        users = fakes.model({
+            'login': fields.char('Login', size=64),
+            'partner_id': fields.many2one('res.partner', 'Partner'),
+        }, 'res.users', self.pool)
+        users._inherits = {'res.partner': 'partner_id'}
+        data = transaction_cache(self.cr, 1, {}).model('res.users')
+        data.update(20, {'login': 'a', 'partner_id': 1})
+        data.update(21, {'login': 'b', 'partner_id': 3})
+        data.pending('_classic')
+        self.partners._invalidate_cache(self.cr, [1], event='unlink')
+        assert data.keys() == [21] and data.has(21, 'login')
+        assert data.pending('_classic') == []
+
+    with it('must drop the fields written on the models inheriting them, at any level'):
+        base = fakes.model({'name': fields.char('Name', size=64)}, 'test.base', self.pool)
+        template = fakes.model({'base_id': fields.many2one('test.base', 'Base')},
+                               'test.template', self.pool)
+        template._inherits = {'test.base': 'base_id'}
+        template._inherit_fields = {'name': ('test.base', 'base_id', base._columns['name'])}
+        product = fakes.model({'template_id': fields.many2one('test.template', 'Template')},
+                              'test.product', self.pool)
+        product._inherits = {'test.template': 'template_id'}
+        product._inherit_fields = {'name': ('test.template', 'template_id', base._columns['name'])}
+        cache = transaction_cache(self.cr, 1, {})
+        for name, link in (('test.template', 'base_id'), ('test.product', 'template_id')):
+            cache.model(name).update(5, {'name': 'a', link: 1})
+        base._invalidate_cache(self.cr, [1], ['name'])
+        assert not cache.model('test.template').has(5, 'name')
+        assert not cache.model('test.product').has(5, 'name')
+        assert cache.model('test.product').has(5, 'template_id')
+
+    with it('must fetch again the fields written'):
+        self.partners._invalidate_cache(self.cr, [1], ['name'])
+        assert not self.data.has(1, 'name') and self.data.has(2, 'name')
+        assert self.data.has(1, 'child_ids')
+        assert self.data.pending('_classic') == [1]
+        assert self.data.pending('child_ids') == []
+
+    with it('must fetch again the one2many fields on a create'):
+        self.partners._invalidate_cache(self.cr, [4], ['name', 'parent_id'], event='create')
+        assert self.data.has(1, 'name') and not self.data.has(1, 'child_ids')
+        assert self.data.pending('child_ids') == [1, 2, 3]
+        assert self.address.has(10, 'partner_id')
+
+
+with description('The prefetch counters'):
+    with it('must estimate the bytes saved from the observed widths'):
+        counters = prefetch_counters()
+        rows = [{'id': 1, 'name': 'abcd', 'note': 'x' * 100}]
+        counters.record('res.partner', '_classic', ['name', 'note'], [], rows)
+        counters.record('res.partner', 'header', ['name'], ['note'], rows * 3)
+        stats = counters.report('res.partner')[('res.partner', 'header')]
+        assert stats['rows'] == 3
+        assert stats['columns'] == 3
+        assert stats['bytes'] == 12
+        assert stats['columns_saved'] == 3
+        assert stats['bytes_saved'] == 300
+
+
+with description('A LRU cache'):
+    with it('must drop the least recently used entries'):
+        cache = lru_cache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1
+        cache['c'] = 3
+        assert 'b' not in cache
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+    with it('must stay consistent when used by several threads'):
+        import threading
+        cache = lru_cache(4)
+        errors = []
+
+        def hammer():
+            try:
+                for i in xrange(2000):
+                    cache[i % 6] = i
+                    cache.get(i % 5)
+                    cache.pop((i + 1) % 6)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=hammer) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors and len(cache) <= 4
@@ -0,0 +1,155 @@
+from ooda import fields
+
+from spec import fakes
+
+
+class cursor(fakes.cursor):
+    def fetchall(self):
+        query, params = self.queries[-1]
+        if 'generate_series' in query:
+            return [(10 + i,) for i in range(params[0])]
+        return []
+
+
+class model(fakes.model):
+    _sequence = 'test_model_id_seq'
+
+    def __init__(self):
+        super(model, self).__init__({
+            'name': fields.char('Name', size=64),
+            'state': fields.selection([('draft', 'Draft'), ('done', 'Done')], 'State'),
+            'qty': fields.integer('Quantity'),
+        })
+
+    def default_get(self, cr, uid, fields_list, context=None):
+        return {}
+
+
+with description('The bulk create'):
+    with it('must reserve the ids in one query and insert the rows by set of columns'):
+        obj = model()
+        cr = cursor()
+        ids = obj.create_multi(cr, 1, [
+            {'name': 'a', 'qty': 1},
+            {'name': 'b', 'qty': 2},
+            {'name': 'c', 'state': 'done'},
+        ])
+        assert ids == [10, 11, 12]
+        assert obj.pool['ir.model.access'].checks == 1
+        inserts = [(q, p) for q, p in cr.queries if q.startswith('insert')]
+        assert len(inserts) == 2
+        query, params = [i for i in inserts if '"qty"' in i[0]][0]
+        assert query.count('(%s') == 2
+        assert params[0] == 10 and 11 in params
+
+    with it('must check the selection values'):
+        try:
+            model().create_multi(cursor(), 1, [{'state': 'wrong'}])
+        except Exception, e:
+            assert 'not in the selection' in str(e.args)
+        else:
+            assert False
+
+    with it('must place each record in the tree, up to a threshold'):
+        from ooda.config import config
+        obj = model()
+        obj._parent_store = True
+        obj._columns['parent_id'] = fields.many2one('test.model', 'Parent')
+        placed = []
+        computed = []
+        obj._parent_store_insert = lambda cr, id, parent: placed.append((id, parent))
+        obj._parent_store_compute = lambda cr: computed.append(cr)
+        obj.create_multi(cursor(), 1, [{'parent_id': 3}, {'name': 'b'}])
+        assert placed == [(10, 3), (11, False)] and not computed
+        config['parent_store_insert_max'] = 1
+        try:
+            obj.create_multi(cursor(), 1, [{'parent_id': 3}, {'name': 'b'}])
+        finally:
+            config['parent_store_insert_max'] = 100
+        assert len(placed) == 2 and len(computed) == 1
+
+
+class write_cursor(cursor):
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        if query.startswith('SELECT id'):
+            self.rowcount = len(params[0])
+
+    def fetchall(self):
+        query, params = self.queries[-1]
+        if 'pg_attribute' in query:
+            return [('name', 'character varying(64)'), ('qty', 'integer')]
+        return []
+
+
+with description('The bulk write'):
+    with it('must write the distinct values of each set of fields in one update'):
+        obj = model()
+        cr = write_cursor()
+        obj.write_multi(cr, 1, {1: {'qty': 3}, 2: {'qty': False}, 3: {'name': 'c', 'qty': 1}})
+        assert obj.pool['ir.model.access'].checks == 1
+        updates = [(q, p) for q, p in cr.queries if q.startswith('UPDATE')]
+        assert len(updates) == 2
+        query, params = [u for u in updates if '"name"' not in u[0]][0]
+        assert '(%s::integer,(%s)::integer),(%s,%s)' in query
+        assert sorted(zip(params[::2], params[1::2])) == [(1, 3), (2, 0)]
+
+    with it('must set the write user and date whatever the fields written'):
+        from StringIO import StringIO
+        obj = model()
+        obj._log_access = True
+        obj._columns['data'] = fields.binary('Data')
+        cr = write_cursor()
+        obj.write_multi(cr, 1, {1: {'data': StringIO('abc')}, 2: {'qty': 1}})
+        updates = [(q, p) for q, p in cr.queries if q.startswith('UPDATE')]
+        assert len([q for q, p in updates if 'write_uid' in q]) == 2
+        assert ('UPDATE "test_model" SET write_uid=%s, write_date=now() WHERE id IN %s', (1, (1,))) in updates
+
+
+with description('The selection check'):
+    with before.each:
+        from ooda.orm import invalidate_selections
+        invalidate_selections('test.model')
+        self.calls = []
+
+        def _kinds(obj, cr, uid, context=None):
+            self.calls.append(uid)
+            return [('a', 'A'), ('b', 'B')]
+        self.obj = model()
+        self.obj._columns['kind'] = fields.selection(_kinds, 'Kind')
+
+    with it('must ask a dynamic selection each time by default'):
+        self.obj.create_multi(cursor(), 1, [{'kind': 'a'}])
+        self.obj.create_multi(cursor(), 1, [{'kind': 'b'}])
+        assert self.calls == [1, 1]
+
+    with it('must keep the values of a dynamic selection until invalidated'):
+        from ooda.config import config
+        from ooda.orm import invalidate_selections
+        config['selection_cache_ttl'] = 60
+        try:
+            self.obj.create_multi(cursor(), 1, [{'kind': 'a'}, {'kind': 'b'}])
+            self.obj.create_multi(cursor(), 1, [{'kind': 'a'}])
+            assert self.calls == [1]
+            invalidate_selections('test.model', 'kind')
+            self.obj.create_multi(cursor(), 1, [{'kind': 'b'}])
+            assert self.calls == [1, 1]
+        finally:
+            config['selection_cache_ttl'] = 0
+
+
+def _totals(cr, table, ids, name, arg, context):
+    return dict((id, id * 10) for id in ids)
+
+
+with description('The store of function fields'):
+    with it('must write the computed values in one update'):
+        obj = model()
+        obj._columns['total'] = fields.function(_totals, type='integer', string='Total', store=True)
+        cr = write_cursor()
+        obj._store_set_values(cr, 1, [1, 2, 3], ['total'], {})
+        updates = [(q, p) for q, p in cr.queries if q.startswith('UPDATE')]
+        assert len(updates) == 1
+        query, params = updates[0]
+        assert 'write_date' not in query
+        assert sorted(zip(params[::2], map(int, params[1::2]))) == [(1, 10), (2, 20), (3, 30)]
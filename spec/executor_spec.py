@@ -0,0 +1,59 @@
+from ooda import fields
+from ooda.executor import snapshot_executor, set_executor
+
+from spec import fakes
+
+
+class cursor(fakes.cursor):
+    def __init__(self, name, rows=None, written=False):
+        super(cursor, self).__init__(rows)
+        self.name = name
+        self.written = written
+
+    def fetchone(self):
+        if 'txid_current_if_assigned' in self.queries[-1][0]:
+            return (not self.written,)
+        return ('00000003-1',)
+
+
+def _cursor_name(cr, table, ids, name, arg, context):
+    return dict((id, '%s:%s' % (name, cr.name)) for id in ids)
+
+
+def model():
+    return fakes.model({
+        'name': fields.char('Name', size=64),
+        'total': fields.function(_cursor_name, type='char', string='Total'),
+        'count': fields.function(_cursor_name, type='char', string='Count'),
+    })
+
+
+with description('A snapshot executor'):
+    with before.each:
+        self.workers = []
+
+        def factory():
+            cr = cursor('worker')
+            self.workers.append(cr)
+            return cr
+        self.executor = snapshot_executor(factory, workers=2)
+
+    with after.each:
+        self.executor.close()
+
+    with it('must compute the function fields in cursors on the snapshot'):
+        cr = cursor('main', [('a', 1), ('b', 2)])
+        set_executor(cr, self.executor)
+        res = model().read(cr, 1, [1, 2], ['name', 'total', 'count'])
+        assert res[1] == {'id': 2, 'name': 'b', 'total': 'total:worker', 'count': 'count:worker'}
+        assert len(self.workers) == 2
+        for wcr in self.workers:
+            assert wcr.queries[1][0] == 'SET TRANSACTION SNAPSHOT %s'
+            assert wcr.closed
+
+    with it('must compute them on the cursor once the transaction has written'):
+        cr = cursor('main', [('a', 1)], written=True)
+        set_executor(cr, self.executor)
+        res = model().read(cr, 1, [1], ['total', 'count'])
+        assert res[0]['total'] == 'total:main'
+        assert not self.workers
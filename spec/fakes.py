@@ -0,0 +1,99 @@
+#
+# Fakes shared by the specs: a cursor recording the queries executed and a
+# registry of models without database
+#
+
+from ooda.orm import orm
+
+
+class cursor(object):
+    """Cursor recording the (query, params) executed, fetching `rows`"""
+    IN_MAX = 1000
+    dbname = 'test'
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.queries = []
+        self.commits = 0
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        self.rowcount = len(self.rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows and self.rows[0] or None
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class table_cursor(cursor):
+    """Cursor answering the SELECTs of columns by ids from `table`,
+    {id: {column: value}}"""
+
+    def __init__(self, table):
+        super(table_cursor, self).__init__()
+        self.table = table
+
+    def execute(self, query, params=None):
+        super(table_cursor, self).execute(query, params)
+        if query.startswith('SELECT '):
+            names = self._columns(query)
+            self.rows = [tuple(id if n == 'id' else self.table[id][n] for n in names)
+                         for id in sorted(params[-1])]
+            self.rowcount = len(self.rows)
+
+    def _columns(self, query):
+        return [f.split('.')[-1].strip('"') for f in query[7:query.index(' FROM ')].split(',')]
+
+    def selects(self):
+        """[(columns, ids)] of the SELECTs executed"""
+        return [(sorted(self._columns(q)), sorted(p[-1]))
+                for q, p in self.queries if q.startswith('SELECT ')]
+
+
+class rule(object):
+    def domain_get(self, cr, uid, model):
+        return '', []
+
+
+class access(object):
+    def __init__(self):
+        self.checks = 0
+
+    def check(self, cr, uid, model, mode, context=None):
+        self.checks += 1
+        return True
+
+
+class registry(dict):
+    _init = False
+
+    def __init__(self, *args, **kwargs):
+        super(registry, self).__init__(*args, **kwargs)
+        self._store_function = {}
+        self.setdefault('ir.rule', rule())
+        self.setdefault('ir.model.access', access())
+
+
+class model(orm):
+    """Model of `columns` in a registry"""
+
+    def __init__(self, columns, name='test.model', pool=None):
+        self.pool = pool if pool is not None else registry()
+        self.pool[name] = self
+        self._name = name
+        self._table = name.replace('.', '_')
+        self._columns = columns
+        self._inherit_fields = {}
+        self._log_access = False
@@ -0,0 +1,40 @@
+from StringIO import StringIO
+
+from ooda import fields
+
+
+class cursor(object):
+    def __init__(self, content):
+        self.content = content
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def fetchone(self):
+        query, (start, length, id) = self.queries[-1]
+        return (self.content[start - 1:start - 1 + length],)
+
+
+class table(object):
+    _table = 'ir_attachment'
+
+
+with description('A binary handle'):
+    with it('must read the content in chunks'):
+        cr = cursor('abcdefg')
+        handle = fields.binary_handle(cr, 'ir_attachment', 'datas', 1, 7)
+        assert list(handle.chunks(3)) == ['abc', 'def', 'g']
+        assert str(handle) == 'abcdefg'
+        assert handle.mmap()[2:4] == 'cd'
+
+with description('A binary field'):
+    with it('must write a file-like object in chunks'):
+        cr = cursor('')
+        fields.binary('Data').set_stream(cr, table(), [1], 'datas', StringIO('abcdefg'), 3)
+        inserts = [p for q, p in cr.queries if q.startswith('INSERT')]
+        assert len(inserts) == 3
+        assert str(inserts[-1][0]).endswith("'g'::bytea")
+        updates = [(q, p) for q, p in cr.queries if q.startswith('UPDATE')]
+        assert len(updates) == 1
+        assert 'string_agg(chunk' in updates[0][0] and updates[0][1] == ((1,),)
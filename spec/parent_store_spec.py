@@ -0,0 +1,175 @@
+from ooda import fields
+from ooda.orm import orm, _rebalance_queue, rebalance_parent_stores
+
+from spec import fakes
+
+
+class cursor(fakes.cursor):
+    def __init__(self, results):
+        super(cursor, self).__init__()
+        # [(start of the query, first parameter or None, result of fetchone)]
+        self.results = results
+
+    def fetchone(self):
+        query, params = self.queries[-1]
+        for start, param, res in self.results:
+            if query.startswith(start) and param in (None, params[0]):
+                return res
+        raise AssertionError(query)
+
+
+class model(fakes.model):
+    _parent_store = True
+    _parent_store_gap = 10
+
+    def __init__(self):
+        super(model, self).__init__({'parent_id': fields.many2one('test.tree', 'Parent')},
+                                    'test.tree')
+        self.computed = 0
+
+    def _parent_store_compute(self, cr):
+        self.computed += 1
+
+
+def updates(cr):
+    return [(q, p) for q, p in cr.queries if q.startswith('update')]
+
+
+with description('A gapped nested set'):
+    with before.each:
+        _rebalance_queue.clear()
+
+    with it('must insert in the room of the parent without shifting the table'):
+        cr = cursor([('select parent_left, parent_right', None, (1, 40)),
+                     ('select max(parent_right)', None, (20,))])
+        model()._parent_store_insert(cr, 7, 3)
+        assert updates(cr) == [('update test_tree set parent_left=%s,parent_right=%s where id=%s',
+                                (21, 29, 7))]
+        assert cr.queries[0][0].endswith('where id=%s for update')
+        assert not _rebalance_queue
+
+    with it('must lock the roots of the table before placing a root'):
+        cr = cursor([('select max(parent_right)', None, (20,))])
+        model()._parent_store_insert(cr, 7, False)
+        assert cr.queries[0][0].startswith('select pg_advisory_xact_lock')
+        assert updates(cr)[0][1] == (21, 32, 7)
+
+    with it('must shift the table and queue a rebalance when the room runs out'):
+        cr = cursor([('select parent_left, parent_right', None, (1, 22)),
+                     ('select max(parent_right)', None, (21,)),
+                     ('select parent_left from', None, (1,))])
+        obj = model()
+        obj._parent_store_insert(cr, 7, 3)
+        assert len(updates(cr)) == 3
+        assert rebalance_parent_stores(cr, obj.pool) == ['test.tree']
+        assert cr.queries[-1][0] == 'LOCK TABLE "test_tree" IN EXCLUSIVE MODE'
+        assert obj.computed == 1 and not _rebalance_queue
+
+    with it('must move a subtree into the room of its new parent'):
+        cr = cursor([('select parent_left, parent_right', 7, (5, 8)),
+                     ('select parent_left, parent_right', 3, (40, 70)),
+                     ('select max(parent_right)', None, (50,))])
+        assert model()._parent_store_gap_move(cr, 7, 3)
+        assert updates(cr)[0][1] == (46, 46, 5, 8)
+
+
+with description('The nested set computation'):
+    with it('must number the trees without recursion, skipping the orphans'):
+        from ooda.orm import nested_intervals
+        left, right = nested_intervals([1, 2, 3, 4, 5, 6], [False, 1, 1, 2, False, 9])
+        assert list(left) == [0, 1, 5, 2, 8, -1]
+        assert list(right) == [7, 4, 6, 3, 9, -1]
+        left, right = nested_intervals(range(1, 100001), [False] + range(1, 100000))
+        assert (left[-1], right[-1]) == (99999, 100000)
+
+    with it('must write the intervals in bulk through a temporary table'):
+        cr = fakes.cursor([(1, False), (2, 1)])
+        obj = model()
+        obj._parent_store_gap = 0
+        orm._parent_store_compute(obj, cr)
+        queries = [q for q, p in cr.queries]
+        assert len(queries) == 5
+        assert queries[1].startswith('CREATE TEMP TABLE "_bulk_test_tree" (id integer, "parent_left" integer')
+        assert cr.queries[2][1] == (1, 0, 3, 2, 1, 2)
+        assert '"parent_left" = _b."parent_left"' in queries[3]
+        assert 'IS DISTINCT FROM' in queries[3]
+
+    with it('must fill the temporary table with COPY when the cursor can'):
+        from ooda.orm import bulk_update
+        cr = fakes.cursor()
+        copies = []
+        cr.copy_expert = lambda query, data: copies.append((query, data.read()))
+        bulk_update(cr, 'test_tree', [('order', 'integer'), ('Name', 'varchar')],
+                    [(1, 2, 'a\tb'), (2, None, 'c')])
+        assert copies == [('COPY "_bulk_test_tree" (id, "order", "Name") FROM STDIN',
+                           '1\t2\ta\\tb\n2\t\\N\tc\n')]
+        assert cr.queries[-2][0].startswith('UPDATE "test_tree" SET "order" = _b."order", "Name" = _b."Name"')
+
+
+class tree(fakes.model):
+    _parent_store = 'path'
+
+    def __init__(self):
+        super(tree, self).__init__({'parent_id': fields.many2one('test.tree', 'Parent')},
+                                   'test.tree')
+
+
+with description('A materialized path'):
+    with it('must list the ancestors of each node'):
+        from ooda.orm import materialized_paths
+        paths = materialized_paths([1, 2, 3, 4], [False, 1, 2, 8])
+        assert paths == [[1], [1, 2], [1, 2, 3], None]
+
+    with it('must compile child_of and parent_of to one predicate'):
+        from ooda.expression import expression
+        e = expression([('id', 'child_of', [3, 4])]).parse(None, 1, tree(), {})
+        query, params = e.to_sql()
+        assert query == '(test_tree.id in (SELECT id FROM "test_tree" WHERE parent_path && ARRAY[%s,%s]::integer[]))'
+        assert params == [3, 4]
+        e = expression([('parent_id', 'parent_of', 3)]).parse(None, 1, tree(), {})
+        assert 'SELECT unnest(parent_path)' in e.to_sql()[0]
+
+    with it('must search child_of recursively on the other many2one fields'):
+        from ooda.expression import expression
+        obj = tree()
+        obj._columns['main_id'] = fields.many2one('test.tree', 'Main')
+        searched = []
+
+        def search(cr, uid, domain, context=None):
+            searched.append(domain)
+            return domain[0][2] == [3] and [5] or []
+        obj.search = search
+        e = expression([('main_id', 'child_of', [3])]).parse(None, 1, obj, {})
+        assert searched == [[('main_id', 'in', [3])], [('main_id', 'in', [5])]]
+        assert e.to_sql()[1] == [3, 5]
+
+    with it('must compute the paths again under a parent without path'):
+        obj = tree()
+        computed = []
+        obj._parent_store_compute = lambda cr: computed.append(cr)
+        cr = fakes.cursor()
+        obj._parent_store_insert(cr, 7, 3)
+        assert cr.queries[0][1] == (7, 3, 7) and len(computed) == 1
+        cr = fakes.cursor([None])
+        obj._parent_store_insert(cr, 8, 3)
+        assert len(computed) == 1
+
+    with it('must move the paths of the subtree only'):
+        cr = cursor([('select parent_path', 7, ([1, 7],)),
+                     ('select parent_path', 3, ([2, 3],))])
+        tree()._parent_path_move(cr, 7, 3)
+        assert cr.queries[-1][0].endswith('where parent_path @> ARRAY[%s]')
+        assert cr.queries[-1][1] == ([2, 3], 2, 7)
+
+    with it('must compute the paths again when the node or its parent has none'):
+        obj = tree()
+        computed = []
+        obj._parent_store_compute = lambda cr: computed.append(cr)
+        cr = cursor([('select parent_path', 7, ([1, 7],)),
+                     ('select parent_path', 3, (None,))])
+        obj._parent_path_move(cr, 7, 3)
+        cr = cursor([('select parent_path', 7, (None,)),
+                     ('select parent_path', 3, ([2, 3],))])
+        obj._parent_path_move(cr, 7, 3)
+        assert len(computed) == 2
+        assert not [q for q, p in cr.queries if q.startswith('update')]
@@ -0,0 +1,222 @@
+import array
+
+from ooda import fields
+from ooda.cache import cursor_state
+
+from spec import fakes
+from spec.fakes import model
+
+
+class cursor(fakes.cursor):
+    def fetchall(self):
+        if 'res_groups_users_rel' in self.queries[-1][0]:
+            return [('base', 'group_user')]
+        return self.rows
+
+
+class table_rows_cursor(fakes.cursor):
+    """Cursor fetching the rows of {table: rows} of the table selected"""
+    def __init__(self, tables):
+        super(table_rows_cursor, self).__init__()
+        self.tables = tables
+
+    def fetchall(self):
+        query = self.queries[-1][0]
+        return self.tables[query[query.index(' FROM "') + 7:].split('"')[0]]
+
+
+class groups_access(fakes.access):
+    """ir.model.access whose check_groups answers from `groups`"""
+    def __init__(self, groups):
+        super(groups_access, self).__init__()
+        self.groups = groups
+        self.asked = []
+
+    def check_groups(self, cr, uid, group):
+        self.asked.append((uid, group))
+        return group in self.groups
+
+
+with description('The columnar read'):
+    with before.each:
+        self.model = model({
+            'name': fields.char('Name', size=64),
+            'qty': fields.integer('Quantity'),
+            'done': fields.boolean('Done'),
+        })
+        self.cr = cursor([('a', 3, True, 2), ('b', None, False, 1)])
+
+    with it('must return the values of each field in the order of the table'):
+        columns = self.model.read_columns(self.cr, 1, [1, 2], ['name', 'qty', 'done'])
+        assert isinstance(columns['qty'], array.array)
+        assert list(columns['id']) == [2, 1]
+        assert columns['name'] == ['a', 'b']
+        assert list(columns['qty']) == [3, 0]
+        assert list(columns['done']) == [1, 0]
+
+    with it('must return tuples and dicts from the same rows'):
+        rows = self.model.read_tuples(self.cr, 1, [1, 2], ['name', 'qty', 'done'])
+        assert rows == [(2, 'a', 3, True), (1, 'b', False, False)]
+        res = self.model.read(self.cr, 1, [1, 2], ['name', 'qty', 'done'])
+        assert res[1] == {'id': 1, 'name': 'b', 'qty': False, 'done': False}
+
+    with it('must build the same dicts as through _read_flat'):
+        res = self.model.read(self.cr, 1, [1, 2], ['name', 'qty', 'done'])
+        self.model._read_by_columns = False
+        assert self.model.read(self.cr, 1, [1, 2], ['name', 'qty', 'done']) == res
+
+    with it('must keep the order of the ids without sorting on the model order'):
+        self.model.read(self.cr, 1, [2, 1, 2], ['name'], preserve_order=True)
+        assert 'WITH ORDINALITY' in self.cr.queries[-1][0]
+        assert self.cr.queries[-1][0].endswith('ORDER BY _ids.pos')
+
+    with it('must hide the fields of groups the user is not in, asking once'):
+        cursor_state(self.cr)
+        self.model._columns['qty'].read = ['base.group_stock']
+        columns = self.model.read_columns(self.cr, 1, [1, 2], ['name', 'qty'], container='list')
+        assert columns['qty'] == [False, False]
+        self.model.read_columns(self.cr, 1, [1, 2], ['name', 'qty'])
+        groups = [q for q, p in self.cr.queries if 'res_groups_users_rel' in q]
+        assert len(groups) == 1
+
+    with it('must ask the groups to ir.model.access when it checks them'):
+        access = groups_access(['base.group_stock'])
+        self.model.pool['ir.model.access'] = access
+        self.model._columns['qty'].read = ['base.group_sale', 'base.group_stock']
+        columns = self.model.read_columns(self.cr, 1, [1, 2], ['name', 'qty', 'done'], container='list')
+        assert columns['qty'] == [3, False]
+        assert access.asked == [(1, 'base.group_sale'), (1, 'base.group_stock')]
+        assert not [q for q, p in self.cr.queries if 'res_groups_users_rel' in q]
+        assert not hasattr(self.cr, '_ooda_state')
+
+
+with description('The read of inherited fields'):
+    with it('must select the stored parent columns with a join'):
+        parent = model({'name': fields.char('Name', size=64)}, 'test.parent')
+        child = model({'parent_id': fields.many2one('test.parent', 'Parent')},
+                      'test.child', parent.pool)
+        child._inherits = {'test.parent': 'parent_id'}
+        child._inherit_fields = {'name': ('test.parent', 'parent_id', parent._columns['name'])}
+        cr = cursor([(5, 'a', 1), (None, None, 2)])
+        res = child.read(cr, 1, [1, 2], ['name'])
+        assert res == [{'id': 1, 'name': 'a'}, {'id': 2, 'name': False}]
+        assert len(cr.queries) == 1
+        assert 'LEFT JOIN "test_parent"' in cr.queries[0][0]
+
+    with it('must read the lazy binary fields on the parents'):
+        parent = model({'image': fields.binary('Image')}, 'test.parent')
+        child = model({'parent_id': fields.many2one('test.parent', 'Parent')},
+                      'test.child', parent.pool)
+        child._inherits = {'test.parent': 'parent_id'}
+        child._inherit_fields = {'image': ('test.parent', 'parent_id', parent._columns['image'])}
+        cr = table_rows_cursor({'test_child': [(5, 1)], 'test_parent': [(7, 5)]})
+        res = child.read(cr, 1, [1], ['image'], context={'bin_lazy': True}, load='_classic_write')
+        handle = res[0]['image']
+        assert isinstance(handle, fields.binary_handle)
+        assert (handle.table, handle.id, len(handle)) == ('test_parent', 5, 7)
+        assert 'JOIN' not in cr.queries[0][0]
+
+
+class fetch_cursor(fakes.cursor):
+    def __init__(self, ids):
+        super(fetch_cursor, self).__init__()
+        self.ids = ids
+
+    def fetchall(self):
+        query, params = self.queries[-1]
+        count = int(query.split()[1])
+        batch, self.ids = self.ids[:count], self.ids[count:]
+        return [(id,) for id in batch]
+
+
+class batches(fakes.model):
+    def __init__(self):
+        super(batches, self).__init__({'name': fields.char('Name', size=64)})
+        self.reads = []
+
+    def read(self, cr, user, ids, fields=None, context=None, load='_classic_read'):
+        self.reads.append(list(ids))
+        return [{'id': id} for id in ids]
+
+
+with description('The iterated read'):
+    with it('must read the ids given by batches'):
+        obj = batches()
+        rows = list(obj.read_iter(fakes.cursor(), 1, [1, 2, 3, 4, 5], ['name'], batch_size=2))
+        assert [r['id'] for r in rows] == [1, 2, 3, 4, 5]
+        assert obj.reads == [[1, 2], [3, 4], [5]]
+        assert list(obj.read_iter(fakes.cursor(), 1, [], ['name'])) == []
+
+    with it('must read all the records for an empty domain'):
+        obj = batches()
+        cr = fetch_cursor([1, 2, 3])
+        rows = list(obj.read_iter(cr, 1, fields=['name'], batch_size=2, domain=[]))
+        assert [r['id'] for r in rows] == [1, 2, 3]
+        assert obj.reads == [[1, 2], [3]]
+        assert cr.queries[0][0].startswith('DECLARE read_iter_')
+        assert 'CURSOR WITH HOLD FOR' in cr.queries[0][0]
+        assert cr.queries[-1][0].startswith('CLOSE read_iter_')
+
+    with it('must close the server side cursor when left early'):
+        cr = fetch_cursor([1, 2, 3, 4])
+        rows = batches().read_iter(cr, 1, fields=['name'], batch_size=2, domain=[('name', '=', 'a')])
+        assert rows.next()['id'] == 1
+        rows.close()
+        assert cr.queries[-1][0].startswith('CLOSE read_iter_')
+        assert len([q for q, p in cr.queries if q.startswith('FETCH')]) == 1
+
+    with it('must check the access before the first row'):
+        obj = batches()
+        cr = fetch_cursor([1])
+        obj.read_iter(cr, 1, fields=['name'], domain=[])
+        assert obj.pool['ir.model.access'].checks == 1
+        assert cr.queries == []
+
+
+class reference_cursor(fakes.cursor):
+    def __init__(self, rows, tables):
+        super(reference_cursor, self).__init__(rows)
+        # {table: ids of the records which exist}
+        self.tables = tables
+
+    def execute(self, query, params=None):
+        super(reference_cursor, self).execute(query, params)
+        if query.startswith('UPDATE'):
+            self.rowcount = 2
+
+    def fetchall(self):
+        query, params = self.queries[-1]
+        if query.startswith('SELECT id FROM'):
+            table = query.split('"')[1]
+            return [(id,) for id in params[0] if id in self.tables.get(table, ())]
+        if query.startswith('SELECT DISTINCT'):
+            return [(row[0],) for row in self.rows]
+        return self.rows
+
+
+with description('The reference fields'):
+    with before.each:
+        self.model = model({'ref': fields.reference('Reference', [], 128)})
+        model({}, 'res.partner', self.model.pool)
+        model({}, 'res.users', self.model.pool)
+
+    with it('must check the targets with one query per model'):
+        cr = reference_cursor([], {'res_partner': [1]})
+        existing = self.model._existing_references(cr, set([
+            'res.partner,1', 'res.partner,2', 'res.partner,x', 'res.users,5', 'unknown.model,3']))
+        assert existing == set(['res.partner,1'])
+        assert len(cr.queries) == 2
+
+    with it('must read the dangling references as empty'):
+        cr = reference_cursor([('res.partner,1', 1), ('res.partner,2', 2), (None, 3)],
+                              {'res_partner': [1]})
+        res = self.model.read(cr, 1, [1, 2, 3], ['ref'])
+        assert [r['ref'] for r in res] == ['res.partner,1', '', False]
+
+    with it('must set the dangling references to NULL'):
+        cr = reference_cursor([('res.partner,1',), ('res.partner,2',), ('res.users,5',)],
+                              {'res_partner': [1]})
+        assert self.model.repair_references(cr, 1) == 2
+        query, params = cr.queries[-1]
+        assert query == 'UPDATE "test_model" SET "ref"=NULL WHERE "ref" = ANY(%s)'
+        assert sorted(params[0]) == ['res.partner,2', 'res.users,5']
@@ -0,0 +1,82 @@
+from ooda import fields
+from ooda.orm import enable_deferred_recompute, flush_recompute
+
+from spec import fakes
+
+
+class cursor(fakes.cursor):
+    def fetchall(self):
+        query, params = self.queries[-1]
+        if query.startswith('SELECT id FROM'):
+            return [(id,) for id in params[0]]
+        return []
+
+
+class model(fakes.model):
+    def __init__(self, pool, name, columns):
+        super(model, self).__init__(columns, name, pool)
+        self.computed = []
+
+    def _store_set_values(self, cr, uid, ids, fields, context):
+        self.computed.append((ids, fields))
+
+
+with description('The deferred recomputation'):
+    with before.each:
+        self.pool = fakes.registry()
+        self.invoice = model(self.pool, 'account.invoice', {
+            'amount': fields.float('Amount'),
+            'name': fields.char('Name', size=64),
+        })
+        self.cr = cursor()
+        enable_deferred_recompute(self.cr)
+
+    with it('must merge the triggers until the commit'):
+        for id in (1, 2, 1):
+            self.invoice._store_recompute(self.cr, 1, [(10, 'account.invoice', [id], ['amount'])], {})
+        assert self.invoice.computed == []
+        self.cr.commit()
+        assert self.invoice.computed == [([1, 2], ['amount'])]
+        assert self.cr.commits == 1
+
+    with it('must flush before a read of the pending fields only'):
+        self.invoice._store_recompute(self.cr, 1, [(10, 'account.invoice', [1], ['amount'])], {})
+        self.invoice._flush_recompute(self.cr, ['name'])
+        assert self.invoice.computed == []
+        self.invoice._flush_recompute(self.cr, ['name', 'amount'])
+        assert self.invoice.computed == [([1], ['amount'])]
+        flush_recompute(self.cr)
+        assert len(self.invoice.computed) == 1
+
+    with it('must flush before a read of fields inherited from a grandparent'):
+        line = model(self.pool, 'account.invoice.line', {})
+        line._inherits = {'account.invoice': 'invoice_id'}
+        line._inherit_fields = {'amount': ('account.invoice', 'invoice_id', None)}
+        tax = model(self.pool, 'account.tax.line', {})
+        tax._inherits = {'account.invoice.line': 'line_id'}
+        tax._inherit_fields = {'amount': ('account.invoice.line', 'line_id', None)}
+        self.invoice._store_recompute(self.cr, 1, [(10, 'account.invoice', [1], ['amount'])], {})
+        tax._flush_recompute(self.cr, ['name'])
+        assert self.invoice.computed == []
+        tax._flush_recompute(self.cr, ['amount'])
+        assert self.invoice.computed == [([1], ['amount'])]
+        self.invoice._store_recompute(self.cr, 1, [(10, 'account.invoice', [2], ['amount'])], {})
+        tax._flush_recompute(self.cr)
+        assert len(self.invoice.computed) == 2
+
+    with it('must recompute once per context'):
+        for id, lang in ((1, 'fr_FR'), (2, 'en_US'), (3, 'fr_FR')):
+            self.invoice._store_recompute(self.cr, 1, [(10, 'account.invoice', [id], ['amount'])],
+                                          {'lang': lang})
+        flush_recompute(self.cr)
+        assert sorted(self.invoice.computed) == [([1, 3], ['amount']), ([2], ['amount'])]
+
+    with it('must drop the pending fields from the transaction cache'):
+        from ooda.cache import enable_transaction_cache, transaction_cache
+        cr = fakes.table_cursor({1: {'amount': 4.0, 'name': 'a'}})
+        enable_transaction_cache(cr)
+        enable_deferred_recompute(cr)
+        transaction_cache(cr, 1, {}).model('account.invoice').update(1, {'amount': 2.0})
+        self.invoice._store_recompute(cr, 1, [(10, 'account.invoice', [1], ['amount'])], {})
+        assert self.invoice.browse(cr, 1, 1).amount == 4.0
+        assert self.invoice.computed == [([1], ['amount'])]